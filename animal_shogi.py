@@ -1,12 +1,23 @@
 # coding: utf-8
 
+import queue
+import threading
 import tkinter as tk
-from tkinter import messagebox
-import random
+from tkinter import filedialog, messagebox
+
+from animal_shogi_engine import (COLS, DROP, NAMES, ROWS, Ponder, Position, SearchStats,
+                                 SharedTranspositionTable, TranspositionTable, evaluate, hash_move, lazy_smp_search,
+                                 make_executor, make_smp_executor, parallel_search, solve_mate)
+from animal_shogi_record import UNFINISHED, RecordWriter, last_record, replay
 
 CELL_SIZE = 80
-ROWS = 4
-COLS = 3
+# hand slots, in the engine's order; hands hold a count per type
+HAND_TYPES = ('chick', 'elephant', 'giraffe')
+TT_SIZE_MB = 16
+AI_MAX_DEPTH = 2
+AI_TIME_MS = 500
+POLL_MS = 50
+RECORD_FILES = [('Animal Shogi games', '*.asgr'), ('All files', '*')]
 
 EMOJIS = {
     'lion': '\U0001F981',  # 🦁
@@ -16,283 +27,250 @@ EMOJIS = {
     'hen': '\U0001F414',
 }
 
-class Piece:
-    def __init__(self, name, owner, promoted=False):
-        self.name = name
-        self.owner = owner  # 0: bottom, 1: top
-        self.promoted = promoted
-
-    @property
-    def display(self):
-        if self.name == 'chick' and self.promoted:
-            return EMOJIS['hen']
-        return EMOJIS[self.name]
-
-    def moves(self):
-        forward = -1 if self.owner == 0 else 1
-        if self.name == 'lion':
-            return [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
-        if self.name == 'giraffe':
-            return [(1,0), (-1,0), (0,1), (0,-1)]
-        if self.name == 'elephant':
-            return [(1,1), (1,-1), (-1,1), (-1,-1)]
-        if self.name == 'chick':
-            if self.promoted:
-                if self.owner == 0:
-                    return [(-1,0), (-1,-1), (-1,1), (0,-1), (0,1), (1,0)]
-                else:
-                    return [(1,0), (1,-1), (1,1), (0,-1), (0,1), (-1,0)]
-            else:
-                return [(forward,0)]
-        return []
-
 class Game:
+    # the strong variant overrides these
+    title = 'Animal Shogi'
+    evaluate = staticmethod(evaluate)
+    max_depth = AI_MAX_DEPTH
+    time_ms = AI_TIME_MS
+    workers = 1
+    # spread the root moves over the workers (parallel_search) instead of
+    # running Lazy SMP helpers
+    split = False
+    # called with the SearchStats of every AI move (on the worker thread),
+    # e.g. print
+    search_log = None
+    # search the expected reply while the player thinks
+    ponder = True
+
     def __init__(self):
-        self.board = [[None for _ in range(COLS)] for _ in range(ROWS)]
-        self.hands = {0: [], 1: []}
-        self.turn = 0  # 0 bottom, 1 top
-        self.selected = None  # (row,col) or ('hand', index)
+        # all game state lives in the engine position; player 1 is side 0
+        self.pos = Position.initial()
+        # start position (SFEN, None for the usual one) and moves, for saving
+        self.start = None
+        self.moves = []
+        self.selected = None  # (row,col) or ('hand', piece type)
+        # with several workers the table is shared with the Lazy SMP helpers
+        if self.workers > 1 and not self.split:
+            self.tt = SharedTranspositionTable(TT_SIZE_MB)
+        else:
+            self.tt = TranspositionTable(TT_SIZE_MB)
+        self.worker = None
+        self.stop = None
+        self.pending = None
+        self.executor = None
+        self.pondering = None
+        self.last_move = None
+        self.tablebase = self.open_tablebase()
+        self.book = self.open_book()
         self.window = tk.Tk()
-        self.window.title('Animal Shogi')
+        self.window.title(self.title)
         # extra space at the bottom for player's hand
         self.hand_size = CELL_SIZE // 2
         canvas_height = ROWS * CELL_SIZE + self.hand_size
         self.canvas = tk.Canvas(self.window, width=COLS*CELL_SIZE, height=canvas_height)
         self.canvas.pack()
         self.canvas.bind('<Button-1>', self.on_click)
-        self.setup_board()
+        self.create_items()
+        menu = tk.Menu(self.window)
+        game_menu = tk.Menu(menu, tearoff=0)
+        game_menu.add_command(label='New Game', command=self.new_game)
+        game_menu.add_command(label='Save Game...', command=self.save_game)
+        game_menu.add_command(label='Load Game...', command=self.load_game)
+        menu.add_cascade(label='Game', menu=game_menu)
+        self.window.config(menu=menu)
+        self.window.protocol('WM_DELETE_WINDOW', self.close)
+        self.new_game()
+
+    @property
+    def turn(self):
+        return self.pos.side
+
+    def open_tablebase(self):
+        return None
+
+    def open_book(self):
+        return None
+
+    def new_game(self):
+        self.cancel_ai()
+        self.selected = None
         # choose whether to move first or second
-        if not messagebox.askyesno('Turn Order', 'Play first? (Yes: first, No: second)'):
-            self.turn = 1
+        first = messagebox.askyesno('Turn Order', 'Play first? (Yes: first, No: second)')
+        self.pos = Position.initial(0 if first else 1)
+        self.start = None if first else self.pos.sfen()
+        self.moves = []
         self.draw()
         if self.turn == 1:
             # CPU moves immediately if player chose second
-            self.window.after(500, self.ai_move)
+            self.pending = self.window.after(500, self.ai_move)
 
-    def ai_move(self):
-        if self.turn != 1:
+    def save_game(self):
+        # appends the game so far to a game record file
+        path = filedialog.asksaveasfilename(title='Save Game', defaultextension='.asgr', filetypes=RECORD_FILES,
+                                            confirmoverwrite=False)
+        if not path:
             return
-
-        def piece_value(p: Piece) -> int:
-            if p.name == 'lion':
-                return 1000
-            if p.name in ('elephant', 'giraffe'):
-                return 5
-            if p.name == 'chick':
-                return 3 if p.promoted else 1
-            return 0
-
-        def evaluate(board, hands):
-            lion0 = False
-            lion1 = False
-            total = 0
-            for r in range(ROWS):
-                for c in range(COLS):
-                    p = board[r][c]
-                    if p:
-                        if p.name == 'lion':
-                            if p.owner == 0:
-                                lion0 = True
-                            else:
-                                lion1 = True
-                        val = piece_value(p)
-                        total += val if p.owner == 1 else -val
-            if not lion0:
-                return float('inf')
-            if not lion1:
-                return float('-inf')
-            for owner, pieces in hands.items():
-                for p in pieces:
-                    val = piece_value(p)
-                    total += val if owner == 1 else -val
-            return total
-
-        def clone_board(board):
-            return [[Piece(p.name, p.owner, p.promoted) if p else None for p in row] for row in board]
-
-        def clone_hands(hands):
-            return {0: [Piece(p.name, p.owner, p.promoted) for p in hands[0]],
-                    1: [Piece(p.name, p.owner, p.promoted) for p in hands[1]]}
-
-        def legal_moves_board(board, r, c, piece):
-            moves = []
-            for dr, dc in piece.moves():
-                nr, nc = r + dr, c + dc
-                if 0 <= nr < ROWS and 0 <= nc < COLS:
-                    target = board[nr][nc]
-                    if not target or target.owner != piece.owner:
-                        moves.append((nr, nc))
-            return moves
-
+        try:
+            with RecordWriter(path) as writer:
+                writer.write(self.moves, UNFINISHED, self.start)
+        except (OSError, ValueError) as e:
+            messagebox.showerror('Save Game', str(e))
+
+    def load_game(self):
+        # continues the last game saved in a game record file
+        path = filedialog.askopenfilename(title='Load Game', filetypes=RECORD_FILES)
+        if not path:
+            return
+        try:
+            record = last_record(path)
+            if record is None:
+                raise ValueError('%s holds no games' % path)
+            pos = replay(record)
+        except (OSError, ValueError) as e:
+            messagebox.showerror('Load Game', str(e))
+            return
+        self.cancel_ai()
+        self.pos = pos
+        self.start = record.start
+        self.moves = record.moves
+        self.selected = None
+        self.draw()
+        winner = self.pos.winner()
+        if winner is not None:
+            self.game_over(winner)
+        elif self.turn == 1:
+            self.pending = self.window.after(500, self.ai_move)
 
     def ai_move(self):
-        if self.turn != 1:
+        self.pending = None
+        if self.turn != 1 or self.worker is not None:
             return
-
-        def piece_value(p: Piece) -> int:
-            if p.name == 'lion':
-                return 1000
-            if p.name in ('elephant', 'giraffe'):
-                return 5
-            if p.name == 'chick':
-                return 3 if p.promoted else 1
-            return 0
-
-        def evaluate(board, hands):
-            lion0 = False
-            lion1 = False
-            total = 0
-            for r in range(ROWS):
-                for c in range(COLS):
-                    p = board[r][c]
-                    if p:
-                        if p.name == 'lion':
-                            if p.owner == 0:
-                                lion0 = True
-                            else:
-                                lion1 = True
-                        val = piece_value(p)
-                        total += val if p.owner == 1 else -val
-            if not lion0:
-                return float('inf')
-            if not lion1:
-                return float('-inf')
-            for owner, pieces in hands.items():
-                for p in pieces:
-                    val = piece_value(p)
-                    total += val if owner == 1 else -val
-            return total
-
-        def clone_board(board):
-            return [[Piece(p.name, p.owner, p.promoted) if p else None for p in row] for row in board]
-
-        def clone_hands(hands):
-            return {0: [Piece(p.name, p.owner, p.promoted) for p in hands[0]],
-                    1: [Piece(p.name, p.owner, p.promoted) for p in hands[1]]}
-
-        def legal_moves_board(board, r, c, piece):
-            moves = []
-            for dr, dc in piece.moves():
-                nr, nc = r + dr, c + dc
-                if 0 <= nr < ROWS and 0 <= nc < COLS:
-                    target = board[nr][nc]
-                    if not target or target.owner != piece.owner:
-                        moves.append((nr, nc))
-            return moves
-
-        def generate_moves(board, hands, player):
-            moves = []
-            for r in range(ROWS):
-                for c in range(COLS):
-                    piece = board[r][c]
-                    if piece and piece.owner == player:
-                        for nr, nc in legal_moves_board(board, r, c, piece):
-                            moves.append(("move", r, c, nr, nc))
-            for idx, piece in enumerate(hands[player]):
-                for r in range(ROWS):
-                    for c in range(COLS):
-                        if board[r][c] is None:
-                            moves.append(("drop", idx, r, c))
-            return moves
-
-        def apply_move(board, hands, move, player):
-            if move[0] == "move":
-                _, sr, sc, r, c = move
-                piece = board[sr][sc]
-                board[sr][sc] = None
-                target = board[r][c]
-                if target:
-                    target.owner = player
-                    target.promoted = False
-                    hands[player].append(target)
-                board[r][c] = Piece(piece.name, player, piece.promoted)
-                if piece.name == 'chick' and not piece.promoted:
-                    if (player == 0 and r == 0) or (player == 1 and r == ROWS - 1):
-                        board[r][c].promoted = True
-            else:
-                _, idx, r, c = move
-                piece = hands[player][idx]
-                board[r][c] = Piece(piece.name, player, piece.promoted)
-                del hands[player][idx]
-            return board, hands
-
-        def minimax(board, hands, depth, player, alpha, beta):
-            if depth == 0:
-                return evaluate(board, hands), None
-            moves = generate_moves(board, hands, player)
-            if not moves:
-                return evaluate(board, hands), None
-            if player == 1:
-                best = float('-inf')
-                best_move = None
-                for mv in moves:
-                    nb, nh = apply_move(clone_board(board), clone_hands(hands), mv, player)
-                    score, _ = minimax(nb, nh, depth - 1, 0, alpha, beta)
-                    if score > best:
-                        best = score
-                        best_move = mv
-                    alpha = max(alpha, best)
-                    if beta <= alpha:
-                        break
-                return best, best_move
+        # book moves are played at once; the tablebase, if any, knows better
+        if self.book is not None and self.tablebase is None:
+            entry = self.book.probe(self.pos)
+            if entry is not None:
+                if self.pondering is not None:
+                    self.pondering.miss()
+                    self.pondering = None
+                self.play_ai_move(entry.move)
+                return
+
+        # search on a worker thread so the Tk loop keeps running; the result
+        # comes back through a queue that poll_ai checks with after()
+        pos = self.pos.copy()
+        ponder = self.pondering
+        self.pondering = None
+        if ponder is not None and ponder.move != self.last_move:
+            ponder.miss()
+            ponder = None
+        # on a ponder hit the pondering search carries on as this move's
+        # search, and its stop event cancels it like any other
+        self.stop = ponder.stop if ponder is not None else threading.Event()
+        results = queue.Queue()
+        self.worker = threading.Thread(target=self.think, args=(pos, self.stop, results, ponder), daemon=True)
+        self.worker.start()
+        self.window.after(POLL_MS, self.poll_ai, results, self.stop)
+
+    def think(self, pos, stop, results, ponder=None):
+        move = None
+        try:
+            if ponder is not None:
+                result = ponder.hit(self.time_ms)
+                move = result.move if result else None
+                return
+            # forced wins first: the solver only follows threats, so it is
+            # quick to answer either way
+            mate = solve_mate(pos, stop=stop)
+            if mate is not None:
+                move = mate[0]
+            elif self.tablebase is not None:
+                move = self.tablebase.best_move(pos)[0]
             else:
-                best = float('inf')
-                best_move = None
-                for mv in moves:
-                    nb, nh = apply_move(clone_board(board), clone_hands(hands), mv, player)
-                    score, _ = minimax(nb, nh, depth - 1, 1, alpha, beta)
-                    if score < best:
-                        best = score
-                        best_move = mv
-                    beta = min(beta, best)
-                    if beta <= alpha:
-                        break
-                return best, best_move
-
-        _, choice = minimax(clone_board(self.board), clone_hands(self.hands), 2, 1, float('-inf'), float('inf'))
-        if choice is None:
-            self.end_turn()
+                if self.executor is None and self.workers > 1:
+                    if self.split:
+                        self.executor = make_executor(self.workers)
+                    else:
+                        self.executor = make_smp_executor(self.tt, self.workers - 1)
+                stats = SearchStats(self.search_log) if self.search_log is not None else None
+                search = parallel_search if self.split else lazy_smp_search
+                result = search(pos, self.max_depth, self.evaluate, self.tt, self.time_ms, stop=stop,
+                                workers=self.workers, executor=self.executor, stats=stats)
+                move = result.move if result else None
+        finally:
+            results.put(move)
+
+    def poll_ai(self, results, stop):
+        if stop.is_set():
             return
+        try:
+            move = results.get_nowait()
+        except queue.Empty:
+            self.window.after(POLL_MS, self.poll_ai, results, stop)
+            return
+        self.worker = None
+        self.play_ai_move(move)
 
-        if choice[0] == "move":
-            _, sr, sc, r, c = choice
-            piece = self.board[sr][sc]
-            target = self.board[r][c]
-            self.board[r][c] = piece
-            self.board[sr][sc] = None
-            if target:
-                target.owner = 1
-                target.promoted = False
-                self.hands[1].append(target)
-                if target.name == 'lion':
-                    messagebox.showinfo('Game Over', 'Computer wins!')
-                    self.window.destroy()
-                    return
-            if piece.name == 'chick' and not piece.promoted and r == ROWS - 1:
-                piece.promoted = True
-        else:
-            _, idx, r, c = choice
-            piece = self.hands[1][idx]
-            self.board[r][c] = Piece(piece.name, 1, piece.promoted)
-            del self.hands[1][idx]
-
-        self.draw()
+    def start_ponder(self):
+        if not self.ponder or self.tablebase is not None:
+            return
+        move = hash_move(self.pos, self.tt)
+        if move is not None:
+            stats = SearchStats(self.search_log) if self.search_log is not None else None
+            self.pondering = Ponder(self.pos, move, self.evaluate, self.tt, self.max_depth, stats)
+
+    def cancel_ai(self):
+        if self.pending is not None:
+            self.window.after_cancel(self.pending)
+            self.pending = None
+        if self.pondering is not None:
+            self.pondering.miss()
+            self.pondering = None
+        if self.worker is not None:
+            # the search checks the event every 1024 nodes, so this is quick
+            self.stop.set()
+            self.worker.join()
+            self.worker = None
+
+    def close(self):
+        self.cancel_ai()
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+        if isinstance(self.tt, SharedTranspositionTable):
+            self.tt.close()
+        if self.tablebase is not None:
+            self.tablebase.close()
+        if self.book is not None:
+            self.book.close()
+        self.window.destroy()
+
+    def play_ai_move(self, move):
+        if move is None:
+            # no legal move left, which loses
+            self.game_over(0)
+            return
+        self.play(move)
+
+    def play(self, move):
+        self.pos.make_move(move)
+        self.moves.append(move)
+        self.last_move = move
+        self.selected = None
+        winner = self.pos.winner()
+        if winner is not None:
+            self.draw()
+            self.game_over(winner)
+            return
         self.end_turn()
 
-    def setup_board(self):
-        # Player 1 (bottom)
-        self.board[3][0] = Piece('giraffe', 0)
-        self.board[3][1] = Piece('lion', 0)
-        self.board[3][2] = Piece('elephant', 0)
-        self.board[2][1] = Piece('chick', 0)
-        # Player 2 (top)
-        self.board[0][0] = Piece('elephant', 1)
-        self.board[0][1] = Piece('lion', 1)
-        self.board[0][2] = Piece('giraffe', 1)
-        self.board[1][1] = Piece('chick', 1)
+    def game_over(self, winner):
+        messagebox.showinfo('Game Over', 'Player 1 wins!' if winner == 0 else 'Computer wins!')
+        self.close()
 
-    def draw(self):
-        self.canvas.delete('all')
+    def create_items(self):
+        # every canvas item is created once; draw() only changes the ones
+        # whose square, hand slot or selection changed since the last call
+        self.square_text = []
         for r in range(ROWS):
             for c in range(COLS):
                 x1 = c * CELL_SIZE
@@ -301,52 +279,66 @@ class Game:
                 y2 = y1 + CELL_SIZE
                 color = '#ffe0e0' if (r + c) % 2 == 0 else '#e0e0ff'
                 self.canvas.create_rectangle(x1, y1, x2, y2, fill=color)
-                piece = self.board[r][c]
-                if piece:
-                    self.canvas.create_text(x1 + CELL_SIZE/2, y1 + CELL_SIZE/2,
-                                             text=piece.display, font=('Arial', 30))
-        # draw player's captured pieces at the bottom
-        for i, piece in enumerate(self.hands[0]):
+                self.square_text.append(self.canvas.create_text(x1 + CELL_SIZE/2, y1 + CELL_SIZE/2,
+                                                                text='', font=('Arial', 30)))
+        # player's captured pieces at the bottom, one slot per type
+        self.hand_text = []
+        self.hand_badge = []
+        for i in range(len(HAND_TYPES)):
             x = i * self.hand_size + self.hand_size/2
             y = ROWS * CELL_SIZE + self.hand_size/2
-            self.canvas.create_text(x, y, text=piece.display, font=('Arial', 20))
+            self.hand_text.append(self.canvas.create_text(x, y, text='', font=('Arial', 20)))
+            self.hand_badge.append(self.canvas.create_text(x + self.hand_size/3, y + self.hand_size/3,
+                                                           text='', font=('Arial', 9)))
+        self.highlight = self.canvas.create_rectangle(0, 0, 0, 0, outline='red', width=3, state='hidden')
+        # what the items currently show
+        self.shown_board = [-1] * (ROWS * COLS)
+        self.shown_hand = [0] * len(HAND_TYPES)
+        self.shown_selected = None
 
-        if self.selected:
+    def draw(self):
+        board = self.pos.mailbox()
+        for sq, code in enumerate(board):
+            if code != self.shown_board[sq]:
+                self.shown_board[sq] = code
+                self.canvas.itemconfig(self.square_text[sq], text=EMOJIS[NAMES[code % 5]] if code >= 0 else '')
+        for i, name in enumerate(HAND_TYPES):
+            count = self.pos.hand_count(0, i)
+            if count != self.shown_hand[i]:
+                self.shown_hand[i] = count
+                self.canvas.itemconfig(self.hand_text[i], text=EMOJIS[name] if count else '')
+                self.canvas.itemconfig(self.hand_badge[i], text=f'x{count}' if count > 1 else '')
+
+        if self.selected != self.shown_selected:
+            self.shown_selected = self.selected
+            if self.selected is None:
+                self.canvas.itemconfig(self.highlight, state='hidden')
+                return
             if self.selected[0] == 'hand':
                 i = self.selected[1]
                 x1 = i * self.hand_size
                 y1 = ROWS * CELL_SIZE
                 x2 = x1 + self.hand_size
                 y2 = y1 + self.hand_size
-                self.canvas.create_rectangle(x1, y1, x2, y2, outline='red', width=3)
             else:
                 r, c = self.selected
                 x1 = c * CELL_SIZE
                 y1 = r * CELL_SIZE
                 x2 = x1 + CELL_SIZE
                 y2 = y1 + CELL_SIZE
-                self.canvas.create_rectangle(x1, y1, x2, y2, outline='red', width=3)
+            self.canvas.coords(self.highlight, x1, y1, x2, y2)
+            self.canvas.itemconfig(self.highlight, state='normal')
 
     def in_bounds(self, r, c):
         return 0 <= r < ROWS and 0 <= c < COLS
 
-    def legal_moves(self, r, c, piece):
-        moves = []
-        for dr, dc in piece.moves():
-            nr, nc = r + dr, c + dc
-            if self.in_bounds(nr, nc):
-                target = self.board[nr][nc]
-                if not target or target.owner != piece.owner:
-                    moves.append((nr, nc))
-        return moves
-
     def on_click(self, event):
         if self.turn != 0:
             return
 
         if event.y >= ROWS * CELL_SIZE:
             index = event.x // self.hand_size
-            if index < len(self.hands[self.turn]):
+            if index < len(HAND_TYPES) and self.pos.hand_count(self.turn, index):
                 self.selected = ('hand', index)
                 self.draw()
             return
@@ -357,50 +349,28 @@ class Game:
             return
         if self.selected:
             if self.selected[0] == 'hand':
-                index = self.selected[1]
-                piece = self.hands[self.turn][index]
-                if self.board[r][c] is None:
-                    self.board[r][c] = Piece(piece.name, self.turn)
-                    del self.hands[self.turn][index]
-                    self.end_turn()
-                self.selected = None
+                frm = DROP + self.selected[1]
             else:
                 sr, sc = self.selected
-                piece = self.board[sr][sc]
-                if piece and piece.owner == self.turn:
-                    if (r, c) in self.legal_moves(sr, sc, piece):
-                        target = self.board[r][c]
-                        if target and target.owner == self.turn:
-                            # do not allow capturing own piece
-                            self.selected = None
-                            self.draw()
-                            return
-                        self.board[r][c] = piece
-                        self.board[sr][sc] = None
-                        if target:
-                            target.owner = self.turn
-                            target.promoted = False
-                            self.hands[self.turn].append(target)
-                            if target.name == 'lion':
-                                messagebox.showinfo('Game Over', f'Player {self.turn+1} wins!')
-                                self.window.destroy()
-                                return
-                        if piece.name == 'chick' and not piece.promoted:
-                            if (piece.owner == 0 and r == 0) or (piece.owner == 1 and r == ROWS - 1):
-                                piece.promoted = True
-                        self.end_turn()
-                self.selected = None
+                frm = sr * COLS + sc
+            move = frm << 4 | (r * COLS + c)
+            self.selected = None
+            # the engine decides what is legal, including not capturing own pieces
+            if self.pos.is_legal(move):
+                self.play(move)
+                return
         else:
-            piece = self.board[r][c]
-            if piece and piece.owner == self.turn:
+            code = self.pos.mailbox()[r * COLS + c]
+            if code >= 0 and code // 5 == self.turn:
                 self.selected = (r, c)
         self.draw()
 
     def end_turn(self):
-        self.turn = 1 - self.turn
         self.draw()
         if self.turn == 1:
-            self.window.after(500, self.ai_move)
+            self.pending = self.window.after(500, self.ai_move)
+        else:
+            self.start_ponder()
 
     def run(self):
         self.window.mainloop()
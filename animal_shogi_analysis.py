@@ -0,0 +1,201 @@
+# coding: utf-8
+
+# Best move and score for many positions, on every core.
+#
+# Positions are read one per line from a file or stdin, as they arrive: an
+# SFEN (Position.sfen) or 'startpos', optionally followed by 'moves' and
+# moves in move_name() text, as in the engine protocol (animal_shogi_usi.py).
+# Blank lines and lines starting with # are skipped. Each position is
+# searched to a fixed depth or for a fixed time with an empty table, and one
+# JSON line per position is written in input order:
+#
+#   {"index": 0, "position": "<input line>", "sfen": "...", "move": "B3-B2",
+#    "score": 2, "depth": 6, "nodes": 1234, "time": 0.05, "pv": [...]}
+#
+# move is null when the game is already over. A line that cannot be read (a
+# bad SFEN or move) gets {"index": ..., "position": ..., "error": "..."}
+# instead; any other failure is a bug and ends the run. Scores are from the
+# side to move's point of view. With --resume the positions already in the
+# output file are skipped and the rest appended, so an interrupted run can be
+# picked up where it stopped.
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from animal_shogi_engine import (Position, SearchStats, TranspositionTable, evaluate, evaluate_positional, move_name,
+                                 parse_move, search)
+
+EVALUATORS = {'material': evaluate, 'positional': evaluate_positional}
+TT_SIZE_MB = 4
+# positions queued per worker, which bounds how far reading runs ahead
+QUEUED_PER_WORKER = 4
+REPORT_SECONDS = 5
+
+_tt = None
+
+
+def _init_worker(tt_size_mb):
+    global _tt
+    _tt = TranspositionTable(tt_size_mb)
+
+
+def parse_position(text):
+    # the position of one input line; raises ValueError
+    words = text.split()
+    if words[:1] == ['startpos']:
+        pos = Position.initial()
+        rest = words[1:]
+    elif len(words) >= 3:
+        pos = Position.from_sfen(' '.join(words[:3]))
+        rest = words[3:]
+    else:
+        raise ValueError('expected an SFEN or startpos')
+    if rest:
+        if rest[0] != 'moves':
+            raise ValueError('expected moves, got %r' % rest[0])
+        for name in rest[1:]:
+            move = parse_move(name)
+            if pos.winner() is not None or not pos.is_legal(move):
+                raise ValueError('illegal move %s' % name)
+            pos.make_move(move)
+    return pos
+
+
+def analyse(index, text, depth, time_ms, evaluator, tt=None):
+    record = {'index': index, 'position': text}
+    try:
+        pos = parse_position(text)
+    except ValueError as e:
+        record['error'] = str(e)
+        return record
+    record['sfen'] = pos.sfen()
+    if tt is not None:
+        tt.clear()
+    stats = SearchStats()
+    result = None
+    if pos.winner() is None and pos.generate_moves():
+        result = search(pos, depth, EVALUATORS[evaluator], tt, time_ms, stats=stats)
+    record.update({
+        'move': move_name(result.move) if result and result.move is not None else None,
+        'score': result.score if result else None,
+        'depth': result.depth if result else 0,
+        'nodes': result.nodes if result else 0,
+        'time': round(result.time, 4) if result else 0.0,
+        'pv': [move_name(move) for move in stats.pv],
+    })
+    return record
+
+
+def _analyse(args):
+    return analyse(*args, tt=_tt)
+
+
+def read_positions(lines, skip=0):
+    # (index, text) of the positions in lines, from the skip-th on
+    index = 0
+    for line in lines:
+        text = line.strip()
+        if not text or text.startswith('#'):
+            continue
+        if index >= skip:
+            yield index, text
+        index += 1
+
+
+def resume_point(path):
+    # Number of complete results in an earlier output file. A line cut short
+    # by the interruption is dropped from the file.
+    if not os.path.exists(path):
+        return 0
+    done = 0
+    keep = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b'\n'):
+                break
+            done += 1
+            keep += len(line)
+    if keep != os.path.getsize(path):
+        with open(path, 'r+b') as f:
+            f.truncate(keep)
+    return done
+
+
+def run(lines, out, workers=None, depth=6, time_ms=None, evaluator='positional', skip=0, log=print):
+    # Analyses the positions of lines across a process pool and writes their
+    # JSON lines to out in input order. Returns the number of positions
+    # analysed per second.
+    workers = workers or os.cpu_count() or 1
+    done = errors = 0
+    start = last = time.perf_counter()
+    pending = deque()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(TT_SIZE_MB,)) as executor:
+        positions = read_positions(lines, skip)
+        while True:
+            while len(pending) < workers * QUEUED_PER_WORKER:
+                item = next(positions, None)
+                if item is None:
+                    break
+                pending.append(executor.submit(_analyse, item + (depth, time_ms, evaluator)))
+            if not pending:
+                break
+            record = pending.popleft().result()
+            out.write(json.dumps(record, separators=(',', ':')) + '\n')
+            done += 1
+            errors += 'error' in record
+            now = time.perf_counter()
+            if now - last >= REPORT_SECONDS:
+                out.flush()
+                log('%d positions (%d to go in the queue), %.1f positions/s'
+                    % (skip + done, len(pending), done / (now - start)))
+                last = now
+    elapsed = time.perf_counter() - start
+    rate = done / elapsed if elapsed else 0.0
+    log('%d positions in %.1fs: %.1f positions/s on %d workers (%d errors, %d skipped)'
+        % (done, elapsed, rate, workers, errors, skip))
+    return rate
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Find the best move of many Animal Shogi positions.')
+    parser.add_argument('input', nargs='?', default='-', help='positions, one per line (default: stdin)')
+    parser.add_argument('--out', default='-', help='JSON lines output file (default: stdout)')
+    parser.add_argument('--depth', type=int, default=6, help='search depth (default: %(default)s)')
+    parser.add_argument('--time-ms', type=int, default=None,
+                        help='time per position; the search stops at --depth or when time is up')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all CPUs)')
+    parser.add_argument('--eval', choices=sorted(EVALUATORS), default='positional', help='evaluation function')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip the positions already in --out and append the rest')
+    args = parser.parse_args(argv)
+    if args.resume and args.out == '-':
+        parser.error('--resume needs --out')
+    log = lambda msg: print(msg, file=sys.stderr)
+    skip = resume_point(args.out) if args.resume else 0
+    if skip:
+        log('resuming after %d positions' % skip)
+    lines = sys.stdin if args.input == '-' else open(args.input)
+    try:
+        settings = (args.workers, args.depth, args.time_ms, args.eval, skip, log)
+        if args.out == '-':
+            run(lines, sys.stdout, *settings)
+        else:
+            with open(args.out, 'a' if args.resume else 'w') as out:
+                run(lines, out, *settings)
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
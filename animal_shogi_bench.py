@@ -0,0 +1,206 @@
+# coding: utf-8
+
+# Perft and search benchmarks for the Animal Shogi engine, without Tk.
+#
+# Perft counts are checked against the stored values below, so a change to
+# move generation or make/unmake that alters them fails the run, as does a
+# failure of the tablebase self-check (index round trip and un-moves on
+# sampled positions, animal_shogi_tablebase.self_check). Searches run
+# at a fixed depth with a fresh transposition table and report nodes, nodes
+# per second, the time at which each depth was reached and the rest of the
+# search statistics (SearchStats.as_dict), along with the node counts of a
+# plain alpha-beta search to the same depth with and without the move
+# ordering heuristics (ordering_report). With --smp the same searches are
+# run as Lazy SMP searches (lazy_smp_search) with each number of processes
+# given, reporting the time to depth and the speedup over the first; --split
+# does the same for the root split (parallel_search). The result is one JSON
+# document, meant to be kept and compared between commits.
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+from animal_shogi_engine import (Position, SearchStats, SharedTranspositionTable, TranspositionTable,
+                                 evaluate_positional, lazy_smp_search, make_executor, make_smp_executor,
+                                 ordering_report, parallel_search, perft, search)
+from animal_shogi_tablebase import self_check
+
+# positions as the moves played from the initial position, with perft
+# counts for depths 1, 2, ...
+POSITIONS = {
+    'initial': ([], (4, 17, 123, 976, 8122, 71677)),
+    'drops': ([116, 19, 168, 4, 138, 37, 183, 49, 117, 21], (21, 472, 6770, 108020, 1269225, 15846007)),
+    'hen': ([168, 71, 183, 4, 139, 64, 184, 4, 139, 64, 184, 37, 195, 4, 139],
+            (14, 84, 898, 7252, 67594, 638909)),
+    'lions': ([116, 20, 183, 65, 171, 196, 117, 37, 199, 71, 183, 82, 154, 203, 120, 19, 171],
+              (14, 161, 1761, 19957, 195909, 1932801)),
+    'midgame': ([166, 71, 103, 197, 122, 20, 183, 88, 150, 33, 121, 18, 151, 69],
+                (14, 78, 814, 6349, 57784, 501985)),
+}
+TT_SIZE_MB = 16
+TABLEBASE_SAMPLES = 500
+
+
+def position(name):
+    pos = Position.initial()
+    for move in POSITIONS[name][0]:
+        pos.make_move(move)
+    return pos
+
+
+def bench_perft(name, depth):
+    expected = POSITIONS[name][1]
+    pos = position(name)
+    start = time.perf_counter()
+    nodes = perft(pos, depth)
+    elapsed = time.perf_counter() - start
+    return {
+        'position': name,
+        'depth': depth,
+        'nodes': nodes,
+        'expected': expected[depth - 1] if depth <= len(expected) else None,
+        'seconds': round(elapsed, 4),
+        'nps': round(nodes / elapsed) if elapsed else None,
+    }
+
+
+def bench_search(name, depth, evaluate=evaluate_positional):
+    stats = SearchStats()
+    search(position(name), depth, evaluate, TranspositionTable(TT_SIZE_MB), stats=stats)
+    report = stats.as_dict()
+    report['position'] = name
+    report['seconds'] = round(report.pop('time'), 4)
+    report['nps'] = round(stats.nodes / report['seconds']) if report['seconds'] else None
+    # time to depth d is the time at which iteration d completed
+    report['iterations'] = [{'depth': it['depth'], 'seconds': round(it['time'], 4), 'nodes': it['nodes'],
+                             'score': it['score'], 'pv': it['pv']} for it in stats.iterations]
+    ordering = ordering_report(position(name), depth, evaluate)
+    ordering['reduction'] = round(ordering['reduction'], 3)
+    report['ordering'] = ordering
+    return report
+
+
+def bench_smp(names, depth, workers, evaluate=evaluate_positional):
+    # time to depth over all the positions, each searched from an empty table
+    tt = SharedTranspositionTable(TT_SIZE_MB)
+    executor = make_smp_executor(tt, workers - 1) if workers > 1 else None
+    try:
+        if executor is not None:
+            # start the helper processes before the clock does
+            list(executor.map(time.sleep, [0.1] * (workers - 1)))
+        seconds = nodes = 0
+        for name in names:
+            tt.clear()
+            result = lazy_smp_search(position(name), depth, evaluate, tt, workers=workers, executor=executor)
+            seconds += result.time
+            nodes += result.nodes
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        tt.close()
+    return {'workers': workers, 'depth': depth, 'seconds': round(seconds, 4), 'nodes': nodes,
+            'nps': round(nodes / seconds) if seconds else None}
+
+
+def bench_split(names, depth, workers, evaluate=evaluate_positional):
+    # as bench_smp, for the root split; workers=1 is the serial search
+    tt = TranspositionTable(TT_SIZE_MB)
+    executor = make_executor(workers) if workers > 1 else None
+    try:
+        if executor is not None:
+            list(executor.map(time.sleep, [0.1] * workers))
+        seconds = nodes = 0
+        for name in names:
+            tt.clear()
+            result = parallel_search(position(name), depth, evaluate, tt, workers=workers, executor=executor)
+            seconds += result.time
+            nodes += result.nodes
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return {'workers': workers, 'depth': depth, 'seconds': round(seconds, 4), 'nodes': nodes,
+            'nps': round(nodes / seconds) if seconds else None}
+
+
+def speedups(rows):
+    # speedup of every row over the first
+    for row in rows:
+        row['speedup'] = round(rows[0]['seconds'] / row['seconds'], 2) if row['seconds'] else None
+    return rows
+
+
+def bench_tablebase(samples=TABLEBASE_SAMPLES):
+    start = time.perf_counter()
+    failures = self_check(samples)
+    return {
+        'samples': samples,
+        'failures': failures,
+        'seconds': round(time.perf_counter() - start, 4),
+    }
+
+
+def run(perft_depth=5, search_depth=8, names=None, smp=(), split=()):
+    names = names or list(POSITIONS)
+    perfts = [bench_perft(name, perft_depth) for name in names]
+    tablebase = bench_tablebase()
+    searches = [bench_search(name, search_depth) for name in names]
+    total = lambda rows, key: sum(row[key] for row in rows)
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'perft': perfts,
+        'tablebase': tablebase,
+        'search': searches,
+        'summary': {
+            'perft_nps': round(total(perfts, 'nodes') / total(perfts, 'seconds')),
+            'search_nps': round(total(searches, 'nodes') / total(searches, 'seconds')),
+            # share of the nodes the move ordering saves over all positions
+            'ordering_reduction': round(1 - sum(row['ordering']['ordered'] for row in searches)
+                                        / sum(row['ordering']['plain'] for row in searches), 3),
+            'perft_ok': all(row['expected'] in (None, row['nodes']) for row in perfts),
+            'tablebase_ok': not tablebase['failures'],
+        },
+    }
+    if smp:
+        report['smp'] = speedups([bench_smp(names, search_depth, workers) for workers in smp])
+    if split:
+        report['split'] = speedups([bench_split(names, search_depth, workers) for workers in split])
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Animal Shogi engine.')
+    parser.add_argument('--perft-depth', type=int, default=5, help='perft depth (default: %(default)s)')
+    parser.add_argument('--search-depth', type=int, default=8, help='search depth (default: %(default)s)')
+    parser.add_argument('--position', action='append', choices=sorted(POSITIONS),
+                        help='benchmark only this position (repeatable)')
+    parser.add_argument('--smp', type=lambda text: [int(n) for n in text.split(',')], default=[],
+                        metavar='N,N,...', help='also time Lazy SMP searches with these process counts, '
+                                               'e.g. 1,2,4,8,16')
+    parser.add_argument('--split', type=lambda text: [int(n) for n in text.split(',')], default=[],
+                        metavar='N,N,...', help='also time root split searches with these process counts, '
+                                               'e.g. 1,2,4,8')
+    parser.add_argument('--out', default='-', help='JSON output file (default: stdout)')
+    args = parser.parse_args(argv)
+    report = run(args.perft_depth, args.search_depth, args.position, args.smp, args.split)
+    text = json.dumps(report, indent=2)
+    if args.out == '-':
+        print(text)
+    else:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    for row in report['perft']:
+        if row['expected'] not in (None, row['nodes']):
+            print('perft mismatch: %s depth %d: %d, expected %d'
+                  % (row['position'], row['depth'], row['nodes'], row['expected']), file=sys.stderr)
+    for failure in report['tablebase']['failures']:
+        print('tablebase check: %s' % failure, file=sys.stderr)
+    return 0 if report['summary']['perft_ok'] and report['summary']['tablebase_ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,194 @@
+# coding: utf-8
+
+# Opening book for Animal Shogi.
+#
+# The builder searches every position reachable in the first --plies plies
+# from the initial position (either side moving first) to a fixed depth,
+# across a process pool, and writes the best moves to a file:
+#
+#   header (16 bytes): 'ASOB', version, 3 reserved bytes, entry count
+#   entries (16 bytes each, sorted by key): key, move, depth, score
+#
+# Positions and their mirror images share an entry, keyed and oriented as in
+# the transposition table (the smaller of Position.key and Position.mkey).
+# Lookups memory-map the file and binary-search it, so opening a book reads
+# nothing but the header and a probe touches a handful of pages.
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from animal_shogi_engine import (MIRROR_MOVE, Position, TranspositionTable, evaluate_positional, move_name,
+                                 search)
+
+HEADER = struct.Struct('<4sB3xQ')
+ENTRY = struct.Struct('<QBBxxi')
+MAGIC = b'ASOB'
+VERSION = 1
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'animal_shogi.book')
+TT_SIZE_MB = 16
+
+# move as played in the probed position; score from the side to move's
+# point of view and the depth it was searched to
+BookMove = namedtuple('BookMove', 'move score depth')
+
+
+def book_key(pos):
+    # (key, mirrored): the entry key of pos and whether moves are mirrored
+    mirrored = pos.mkey < pos.key
+    return (pos.mkey if mirrored else pos.key), mirrored
+
+
+class OpeningBook:
+    def __init__(self, path=DEFAULT_PATH):
+        self.file = open(path, 'rb')
+        try:
+            self.table = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError('%s is not an Animal Shogi opening book' % path) from None
+        if len(self.table) < HEADER.size:
+            self.close()
+            raise ValueError('%s is not an Animal Shogi opening book' % path)
+        magic, version, self.count = HEADER.unpack_from(self.table)
+        if magic != MAGIC or version != VERSION or len(self.table) != HEADER.size + self.count * ENTRY.size:
+            self.close()
+            raise ValueError('%s is not an Animal Shogi opening book' % path)
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.table.close()
+        self.file.close()
+
+    def probe(self, pos):
+        # the BookMove for pos, or None if it is not in the book
+        key, mirrored = book_key(pos)
+        table = self.table
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            found, move, depth, score = ENTRY.unpack_from(table, HEADER.size + mid * ENTRY.size)
+            if found < key:
+                lo = mid + 1
+            elif found > key:
+                hi = mid
+            else:
+                if mirrored:
+                    move = MIRROR_MOVE[move]
+                return BookMove(move, score, depth) if pos.is_legal(move) else None
+        return None
+
+
+def open_book(path=DEFAULT_PATH):
+    # the book at path, or None if there is none
+    if not os.path.exists(path):
+        return None
+    try:
+        return OpeningBook(path)
+    except ValueError:
+        return None
+
+
+def book_positions(plies):
+    # the undecided positions within plies plies of the initial position,
+    # one per entry key
+    seen = set()
+    positions = []
+    frontier = [Position.initial(0), Position.initial(1)]
+    for _ in range(plies):
+        following = []
+        for pos in frontier:
+            key, _ = book_key(pos)
+            if key in seen or pos.winner() is not None:
+                continue
+            moves = pos.generate_moves()
+            if not moves:
+                continue
+            seen.add(key)
+            positions.append(pos)
+            for move in moves:
+                child = pos.copy()
+                child.make_move(move)
+                following.append(child)
+        frontier = following
+    return positions
+
+
+_tt = None
+
+
+def _init_worker(tt_size_mb):
+    global _tt
+    _tt = TranspositionTable(tt_size_mb)
+
+
+def _search_position(args):
+    pos, depth, time_ms = args
+    # an empty table for every position, so that an entry does not depend on
+    # which positions its worker happened to search before
+    _tt.clear()
+    result = search(pos, depth, evaluate_positional, _tt, time_ms)
+    key, mirrored = book_key(pos)
+    move = MIRROR_MOVE[result.move] if mirrored else result.move
+    return key, move, result.depth, result.score
+
+
+def build(path=DEFAULT_PATH, plies=4, depth=12, time_ms=None, workers=None, log=print):
+    # Searches the book positions and writes the book to path, replacing it
+    # only once complete. Returns the number of entries.
+    workers = workers or os.cpu_count() or 1
+    positions = book_positions(plies)
+    log('%d positions within %d plies' % (len(positions), plies))
+    entries = []
+    start = time.perf_counter()
+    tasks = [(pos, depth, time_ms) for pos in positions]
+    chunksize = max(1, min(16, len(tasks) // (workers * 8)))
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(TT_SIZE_MB,)) as executor:
+        for done, entry in enumerate(executor.map(_search_position, tasks, chunksize=chunksize), 1):
+            entries.append(entry)
+            if done % 100 == 0:
+                log('%d/%d positions, %.1f positions/s' % (done, len(tasks), done / (time.perf_counter() - start)))
+    entries.sort()
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(entries)))
+        for entry in entries:
+            f.write(ENTRY.pack(*entry))
+    os.replace(tmp, path)
+    log('%d entries in %.1fs' % (len(entries), time.perf_counter() - start))
+    return len(entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build or query the Animal Shogi opening book.')
+    parser.add_argument('--out', default=DEFAULT_PATH, help='book file (default: %(default)s)')
+    parser.add_argument('--plies', type=int, default=4, help='plies from the initial position (default: %(default)s)')
+    parser.add_argument('--depth', type=int, default=12, help='search depth (default: %(default)s)')
+    parser.add_argument('--time-ms', type=int, default=None, help='time limit per position')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all CPUs)')
+    parser.add_argument('--probe', action='store_true', help='show the book move of the initial position')
+    args = parser.parse_args(argv)
+    log = lambda msg: print(msg, file=sys.stderr)
+    if args.probe:
+        book = OpeningBook(args.out)
+        entry = book.probe(Position.initial())
+        if entry is None:
+            print('initial position: not in the book (%d entries)' % len(book))
+        else:
+            print('initial position: %s, score %d at depth %d (%d entries)'
+                  % (move_name(entry.move), entry.score, entry.depth, len(book)))
+        book.close()
+        return 0
+    build(args.out, args.plies, args.depth, args.time_ms, args.workers, log)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1487 @@
+# coding: utf-8
+
+# Bitboard engine for Animal Shogi. Nothing here needs a display: the Tk
+# games and the self-play runner are all built on Position and search().
+#
+# Squares are numbered r * COLS + c, row 0 being the top (player 1) side.
+# Every piece type of every side has one 12-bit mask in Position.bb, indexed
+# by side * 5 + piece type. Hands are counts packed two bits per piece type.
+#
+# A game is won by capturing the enemy lion or by a try: moving one's own
+# lion onto the far rank (the promotion zone) where the opponent cannot
+# capture it on the next move.
+
+import multiprocessing
+import os
+import random
+import threading
+import time
+from array import array
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing.shared_memory import SharedMemory
+
+ROWS = 4
+COLS = 3
+SQUARES = ROWS * COLS
+FULL = (1 << SQUARES) - 1
+
+CHICK, ELEPHANT, GIRAFFE, LION, HEN = range(5)
+NAMES = ('chick', 'elephant', 'giraffe', 'lion', 'hen')
+PIECE_VALUES = (1, 5, 5, 1000, 3)
+
+# moves are encoded as (from << 4) | to, drops use from = DROP + piece type
+DROP = SQUARES
+
+WIN = 100000
+
+PROMOTION_ZONE = (FULL >> (COLS * (ROWS - 1)), FULL << (COLS * (ROWS - 1)) & FULL)
+
+BITS = [tuple(sq for sq in range(SQUARES) if mask >> sq & 1) for mask in range(1 << SQUARES)]
+
+
+def _steps(ptype, owner):
+    forward = -1 if owner == 0 else 1
+    if ptype == LION:
+        return [(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc]
+    if ptype == GIRAFFE:
+        return [(1, 0), (-1, 0), (0, 1), (0, -1)]
+    if ptype == ELEPHANT:
+        return [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+    if ptype == HEN:
+        return [(forward, 0), (forward, -1), (forward, 1), (0, -1), (0, 1), (-forward, 0)]
+    return [(forward, 0)]
+
+
+def _attack_table():
+    table = []
+    for owner in (0, 1):
+        for ptype in range(5):
+            masks = []
+            for sq in range(SQUARES):
+                r, c = divmod(sq, COLS)
+                mask = 0
+                for dr, dc in _steps(ptype, owner):
+                    nr, nc = r + dr, c + dc
+                    if 0 <= nr < ROWS and 0 <= nc < COLS:
+                        mask |= 1 << (nr * COLS + nc)
+                masks.append(mask)
+            table.append(masks)
+    return table
+
+
+# ATTACKS[owner * 5 + type][sq] is the mask of squares the piece attacks,
+# the promoted chick being the type HEN. MOVES[frm][mask] lists the moves
+# from frm (a square, or DROP + type for a drop) to the squares of mask, so
+# that move generation is a table lookup per piece.
+ATTACKS = _attack_table()
+MOVES = [[tuple(frm << 4 | to for to in BITS[mask]) for mask in range(1 << SQUARES)]
+         for frm in range(DROP + 3)]
+
+
+def hand_shift(side, ptype):
+    return (side * 3 + ptype) * 2
+
+
+def mirror_square(sq):
+    r, c = divmod(sq, COLS)
+    return r * COLS + COLS - 1 - c
+
+
+def mirror_move(move):
+    frm, to = move >> 4, move & 15
+    if frm < DROP:
+        frm = mirror_square(frm)
+    return frm << 4 | mirror_square(to)
+
+
+# Zobrist keys. Every position also carries the key of its left/right
+# mirror image (same tables, mirrored squares) so that the transposition
+# table can store both under the smaller of the two keys.
+_rng = random.Random(20240601)
+ZOBRIST_PIECE = [[_rng.getrandbits(64) for _ in range(SQUARES)] for _ in range(10)]
+ZOBRIST_MIRROR = [[keys[mirror_square(sq)] for sq in range(SQUARES)] for keys in ZOBRIST_PIECE]
+ZOBRIST_HAND = [[0, _rng.getrandbits(64), _rng.getrandbits(64), 0] for _ in range(6)]
+ZOBRIST_SIDE = _rng.getrandbits(64)
+MIRROR_MOVE = [mirror_move(m) if (m >> 4) < DROP + 3 and (m & 15) < SQUARES else m for m in range(256)]
+
+
+# Evaluation terms, kept up to date by make/unmake like the keys. Both are
+# from player 1's (side 1's) point of view: MATERIAL is what evaluate()
+# returns, BONUS the extra of evaluate_positional() for chicks advancing
+# towards promotion, worth more for player 1's chicks in hand. Lions count
+# for nothing; a captured lion is seen on the bitboards.
+HAND_CHICK_BONUS = (ROWS, 1)
+SQUARE_MATERIAL = [[(PIECE_VALUES[code % 5] if code % 5 != LION else 0) * (1 if code >= 5 else -1)
+                    for _ in range(SQUARES)] for code in range(10)]
+SQUARE_BONUS = [[0] * SQUARES for _ in range(10)]
+SQUARE_BONUS[CHICK] = [-(ROWS - sq // COLS) for sq in range(SQUARES)]
+SQUARE_BONUS[5 + CHICK] = [sq // COLS + 1 for sq in range(SQUARES)]
+HAND_MATERIAL = [PIECE_VALUES[i % 3] * (1 if i >= 3 else -1) for i in range(6)]
+HAND_BONUS = [-HAND_CHICK_BONUS[0], 0, 0, HAND_CHICK_BONUS[1], 0, 0]
+# make_move keeps the previous scores in the undo record, offset to be
+# non-negative
+SCORE_OFFSET = 1 << 9
+
+# Set ANIMAL_SHOGI_CHECK=1 to have every evaluation compare the incremental
+# scores with a full recomputation.
+CHECK_SCORES = bool(os.environ.get('ANIMAL_SHOGI_CHECK'))
+
+
+class Position:
+    __slots__ = ('bb', 'occ', 'hands', 'side', 'key', 'mkey', 'material', 'bonus')
+
+    def __init__(self, bb=None, occ=None, hands=0, side=0):
+        self.bb = bb if bb is not None else [0] * 10
+        self.occ = occ if occ is not None else [0, 0]
+        self.hands = hands
+        self.side = side
+        self.key, self.mkey = self.compute_keys()
+        self.material, self.bonus = self.compute_scores()
+
+    def compute_keys(self):
+        key = mkey = ZOBRIST_SIDE if self.side else 0
+        for code in range(10):
+            for sq in BITS[self.bb[code]]:
+                key ^= ZOBRIST_PIECE[code][sq]
+                mkey ^= ZOBRIST_MIRROR[code][sq]
+        for i in range(6):
+            h = ZOBRIST_HAND[i][self.hands >> (i * 2) & 3]
+            key ^= h
+            mkey ^= h
+        return key, mkey
+
+    def compute_scores(self):
+        material = bonus = 0
+        for code in range(10):
+            for sq in BITS[self.bb[code]]:
+                material += SQUARE_MATERIAL[code][sq]
+                bonus += SQUARE_BONUS[code][sq]
+        for i in range(6):
+            n = self.hands >> (i * 2) & 3
+            material += HAND_MATERIAL[i] * n
+            bonus += HAND_BONUS[i] * n
+        return material, bonus
+
+    @classmethod
+    def initial(cls, side=0):
+        pos = cls(side=side)
+        for owner, ptype, r, c in ((0, GIRAFFE, 3, 0), (0, LION, 3, 1), (0, ELEPHANT, 3, 2),
+                                   (0, CHICK, 2, 1), (1, ELEPHANT, 0, 0), (1, LION, 0, 1),
+                                   (1, GIRAFFE, 0, 2), (1, CHICK, 1, 1)):
+            pos.put(owner, ptype, r * COLS + c)
+        return pos
+
+    @classmethod
+    def from_sfen(cls, text):
+        # inverse of sfen(); raises ValueError on malformed text
+        try:
+            board, side, hands = text.split()
+            rows = board.split('/')
+            if len(rows) != ROWS or side not in 'bw':
+                raise ValueError
+            pos = cls(side='bw'.index(side))
+            for r, row in enumerate(rows):
+                c = 0
+                for ch in row:
+                    if ch.isdigit():
+                        c += int(ch)
+                        continue
+                    if c >= COLS:
+                        raise ValueError
+                    pos.put(0 if ch.isupper() else 1, PIECE_LETTERS.index(ch.upper()), r * COLS + c)
+                    c += 1
+                if c != COLS:
+                    raise ValueError
+            count = 1
+            for ch in '' if hands == '-' else hands:
+                if ch.isdigit():
+                    count = int(ch)
+                    continue
+                owner = 0 if ch.isupper() else 1
+                ptype = PIECE_LETTERS[:3].index(ch.upper())
+                # two bits per hand slot
+                if pos.hand_count(owner, ptype) + count > 2:
+                    raise ValueError
+                for _ in range(count):
+                    pos.add_to_hand(owner, ptype)
+                count = 1
+            # one lion a side and two of every other kind, a hen counting
+            # as the chick it was, as in every game: the search relies on the
+            # lions and the tablebase index on the counts
+            bb = pos.bb
+            if len(BITS[bb[LION]]) != 1 or len(BITS[bb[5 + LION]]) != 1:
+                raise ValueError
+            for ptype in (CHICK, ELEPHANT, GIRAFFE):
+                on_board = bb[ptype] | bb[5 + ptype]
+                if ptype == CHICK:
+                    on_board |= bb[HEN] | bb[5 + HEN]
+                if len(BITS[on_board]) + pos.hand_count(0, ptype) + pos.hand_count(1, ptype) != 2:
+                    raise ValueError
+        except ValueError:
+            raise ValueError('bad position: %r' % text) from None
+        return pos
+
+    def sfen(self):
+        # SFEN-like text: rows from the top separated by '/', player 1's
+        # pieces in upper case, digits for empty squares, then b or w for
+        # the side to move (b moves first) and the hands, e.g. the initial
+        # position is 'elg/1c1/1C1/GLE b -'
+        board = self.mailbox()
+        rows = []
+        for r in range(ROWS):
+            row = ''
+            empty = 0
+            for code in board[r * COLS:(r + 1) * COLS]:
+                if code < 0:
+                    empty += 1
+                    continue
+                if empty:
+                    row += str(empty)
+                    empty = 0
+                letter = PIECE_LETTERS[code % 5]
+                row += letter if code < 5 else letter.lower()
+            rows.append(row + (str(empty) if empty else ''))
+        hands = ''
+        for side in (0, 1):
+            for ptype in (CHICK, ELEPHANT, GIRAFFE):
+                n = self.hand_count(side, ptype)
+                if n:
+                    letter = PIECE_LETTERS[ptype] if side == 0 else PIECE_LETTERS[ptype].lower()
+                    hands += (str(n) if n > 1 else '') + letter
+        return '%s %s %s' % ('/'.join(rows), 'bw'[self.side], hands or '-')
+
+    def copy(self):
+        pos = Position.__new__(Position)
+        pos.bb = list(self.bb)
+        pos.occ = list(self.occ)
+        pos.hands = self.hands
+        pos.side = self.side
+        pos.key = self.key
+        pos.mkey = self.mkey
+        pos.material = self.material
+        pos.bonus = self.bonus
+        return pos
+
+    def put(self, owner, ptype, sq):
+        code = owner * 5 + ptype
+        self.bb[code] |= 1 << sq
+        self.occ[owner] |= 1 << sq
+        self.key ^= ZOBRIST_PIECE[code][sq]
+        self.mkey ^= ZOBRIST_MIRROR[code][sq]
+        self.material += SQUARE_MATERIAL[code][sq]
+        self.bonus += SQUARE_BONUS[code][sq]
+
+    def add_to_hand(self, owner, ptype):
+        i = owner * 3 + ptype
+        n = self.hands >> (i * 2) & 3
+        delta = ZOBRIST_HAND[i][n] ^ ZOBRIST_HAND[i][n + 1]
+        self.hands += 1 << (i * 2)
+        self.key ^= delta
+        self.mkey ^= delta
+        self.material += HAND_MATERIAL[i]
+        self.bonus += HAND_BONUS[i]
+
+    def mailbox(self):
+        # piece code (side * 5 + type) on every square, -1 when empty
+        board = [-1] * SQUARES
+        bb = self.bb
+        for code in range(10):
+            for sq in BITS[bb[code]]:
+                board[sq] = code
+        return board
+
+    def hand_count(self, side, ptype):
+        return (self.hands >> hand_shift(side, ptype)) & 3
+
+    def attacked(self, sq, by):
+        # whether a piece of side by attacks sq; every piece attacks from x
+        # to sq exactly when the same piece of the other side would attack
+        # from sq to x
+        bb = self.bb
+        base = by * 5
+        other = (1 - by) * 5
+        for ptype in range(5):
+            if ATTACKS[other + ptype][sq] & bb[base + ptype]:
+                return True
+        return False
+
+    def winner(self):
+        # the side that has won by a lion capture or a try, None while the
+        # game goes on
+        bb = self.bb
+        if not bb[LION]:
+            return 1
+        if not bb[5 + LION]:
+            return 0
+        side = self.side
+        opp = 1 - side
+        if bb[side * 5 + LION] & PROMOTION_ZONE[side]:
+            # the opponent left the lion standing on the far rank
+            return side
+        lion = bb[opp * 5 + LION]
+        if lion & PROMOTION_ZONE[opp] and not self.attacked(lion.bit_length() - 1, side):
+            return opp
+        return None
+
+    def winning_move(self, side=None):
+        # a move that wins on the spot for side (default: the side to move):
+        # capturing the enemy lion, or a try to a square the opponent does
+        # not attack; None if there is none
+        if side is None:
+            side = self.side
+        opp = 1 - side
+        bb = self.bb
+        base = side * 5
+        lion = bb[opp * 5 + LION]
+        if not lion or not bb[base + LION]:
+            return None
+        sq = lion.bit_length() - 1
+        for ptype in range(5):
+            attackers = ATTACKS[opp * 5 + ptype][sq] & bb[base + ptype]
+            if attackers:
+                return (attackers.bit_length() - 1) << 4 | sq
+        frm = bb[base + LION].bit_length() - 1
+        for to in BITS[ATTACKS[base + LION][frm] & PROMOTION_ZONE[side] & ~self.occ[side]]:
+            if not self.attacked(to, opp):
+                return frm << 4 | to
+        return None
+
+    def generate_moves(self):
+        side = self.side
+        bb = self.bb
+        base = side * 5
+        not_own = ~self.occ[side]
+        moves = []
+        for ptype in range(5):
+            attacks = ATTACKS[base + ptype]
+            for sq in BITS[bb[base + ptype]]:
+                moves += MOVES[sq][attacks[sq] & not_own]
+        hands = self.hands >> (side * 6)
+        if hands:
+            empty = FULL & ~(self.occ[0] | self.occ[1])
+            for ptype in (CHICK, ELEPHANT, GIRAFFE):
+                if hands >> (ptype * 2) & 3:
+                    moves += MOVES[DROP + ptype][empty]
+        return moves
+
+    def is_legal(self, move):
+        # same as move in self.generate_moves(), without generating them
+        frm = move >> 4
+        to = move & 15
+        side = self.side
+        if to >= SQUARES:
+            return False
+        if frm >= DROP:
+            return frm < DROP + 3 and (self.hands >> hand_shift(side, frm - DROP) & 3) > 0 \
+                and not (self.occ[0] | self.occ[1]) >> to & 1
+        if not self.occ[side] >> frm & 1 or self.occ[side] >> to & 1:
+            return False
+        base = side * 5
+        for ptype in range(5):
+            if self.bb[base + ptype] >> frm & 1:
+                return ATTACKS[base + ptype][frm] >> to & 1 == 1
+
+    def make_move(self, move):
+        # plays the move in place and returns the undo record for unmake_move:
+        # moved type | (captured type + 1) << 3 | promoted << 6, with the
+        # previous material and bonus (plus SCORE_OFFSET) from bit 7 and 17
+        side = self.side
+        bb = self.bb
+        occ = self.occ
+        frm = move >> 4
+        to = move & 15
+        to_bit = 1 << to
+        self.side = 1 - side
+        key = self.key ^ ZOBRIST_SIDE
+        mkey = self.mkey ^ ZOBRIST_SIDE
+        material = self.material
+        bonus = self.bonus
+        scores = (material + SCORE_OFFSET) << 7 | (bonus + SCORE_OFFSET) << 17
+        if frm >= DROP:
+            ptype = frm - DROP
+            i = side * 3 + ptype
+            n = self.hands >> (i * 2) & 3
+            h = ZOBRIST_HAND[i][n] ^ ZOBRIST_HAND[i][n - 1]
+            self.hands -= 1 << (i * 2)
+            code = side * 5 + ptype
+            bb[code] |= to_bit
+            occ[side] |= to_bit
+            self.key = key ^ h ^ ZOBRIST_PIECE[code][to]
+            self.mkey = mkey ^ h ^ ZOBRIST_MIRROR[code][to]
+            # a piece in hand is worth as much as on the board
+            self.bonus = bonus + SQUARE_BONUS[code][to] - HAND_BONUS[i]
+            return scores | ptype
+        undo = 0
+        opp = 1 - side
+        if occ[opp] & to_bit:
+            base = opp * 5
+            for captured in range(5):
+                if bb[base + captured] & to_bit:
+                    break
+            code = base + captured
+            bb[code] ^= to_bit
+            occ[opp] ^= to_bit
+            key ^= ZOBRIST_PIECE[code][to]
+            mkey ^= ZOBRIST_MIRROR[code][to]
+            material -= SQUARE_MATERIAL[code][to]
+            bonus -= SQUARE_BONUS[code][to]
+            if captured != LION:
+                i = side * 3 + (CHICK if captured == HEN else captured)
+                n = self.hands >> (i * 2) & 3
+                h = ZOBRIST_HAND[i][n] ^ ZOBRIST_HAND[i][n + 1]
+                self.hands += 1 << (i * 2)
+                key ^= h
+                mkey ^= h
+                material += HAND_MATERIAL[i]
+                bonus += HAND_BONUS[i]
+            undo = (captured + 1) << 3
+        from_bit = 1 << frm
+        base = side * 5
+        for ptype in range(5):
+            if bb[base + ptype] & from_bit:
+                break
+        code = base + ptype
+        bb[code] ^= from_bit
+        key ^= ZOBRIST_PIECE[code][frm]
+        mkey ^= ZOBRIST_MIRROR[code][frm]
+        material -= SQUARE_MATERIAL[code][frm]
+        bonus -= SQUARE_BONUS[code][frm]
+        if ptype == CHICK and to_bit & PROMOTION_ZONE[side]:
+            code = base + HEN
+            undo |= 64
+        bb[code] |= to_bit
+        occ[side] ^= from_bit | to_bit
+        self.key = key ^ ZOBRIST_PIECE[code][to]
+        self.mkey = mkey ^ ZOBRIST_MIRROR[code][to]
+        self.material = material + SQUARE_MATERIAL[code][to]
+        self.bonus = bonus + SQUARE_BONUS[code][to]
+        return scores | undo | ptype
+
+    def unmake_move(self, move, undo):
+        side = 1 - self.side
+        self.side = side
+        bb = self.bb
+        occ = self.occ
+        frm = move >> 4
+        to = move & 15
+        to_bit = 1 << to
+        ptype = undo & 7
+        key = self.key ^ ZOBRIST_SIDE
+        mkey = self.mkey ^ ZOBRIST_SIDE
+        self.material = (undo >> 7 & 1023) - SCORE_OFFSET
+        self.bonus = (undo >> 17 & 1023) - SCORE_OFFSET
+        if frm >= DROP:
+            i = side * 3 + ptype
+            n = self.hands >> (i * 2) & 3
+            h = ZOBRIST_HAND[i][n] ^ ZOBRIST_HAND[i][n + 1]
+            self.hands += 1 << (i * 2)
+            code = side * 5 + ptype
+            bb[code] ^= to_bit
+            occ[side] ^= to_bit
+            self.key = key ^ h ^ ZOBRIST_PIECE[code][to]
+            self.mkey = mkey ^ h ^ ZOBRIST_MIRROR[code][to]
+            return
+        from_bit = 1 << frm
+        base = side * 5
+        code = base + (HEN if undo & 64 else ptype)
+        bb[code] ^= to_bit
+        key ^= ZOBRIST_PIECE[code][to]
+        mkey ^= ZOBRIST_MIRROR[code][to]
+        code = base + ptype
+        bb[code] |= from_bit
+        key ^= ZOBRIST_PIECE[code][frm]
+        mkey ^= ZOBRIST_MIRROR[code][frm]
+        occ[side] ^= from_bit | to_bit
+        captured = (undo >> 3 & 7) - 1
+        if captured >= 0:
+            opp = 1 - side
+            code = opp * 5 + captured
+            bb[code] |= to_bit
+            occ[opp] |= to_bit
+            key ^= ZOBRIST_PIECE[code][to]
+            mkey ^= ZOBRIST_MIRROR[code][to]
+            if captured != LION:
+                i = side * 3 + (CHICK if captured == HEN else captured)
+                n = self.hands >> (i * 2) & 3
+                h = ZOBRIST_HAND[i][n] ^ ZOBRIST_HAND[i][n - 1]
+                self.hands -= 1 << (i * 2)
+                key ^= h
+                mkey ^= h
+        self.key = key
+        self.mkey = mkey
+
+
+# Moves are single bytes, (from << 4) | to, so a game is bytes(moves). In
+# text they are written like B3-B2, or C*B2 for a chick drop: files A-C
+# from the left and ranks 1-4 from the top.
+PIECE_LETTERS = 'CEGLH'
+
+
+def move_name(move):
+    frm, to = move >> 4, move & 15
+    square = lambda sq: 'ABC'[sq % COLS] + str(sq // COLS + 1)
+    if frm >= DROP:
+        return PIECE_LETTERS[frm - DROP] + '*' + square(to)
+    return square(frm) + '-' + square(to)
+
+
+def parse_move(text):
+    # inverse of move_name(); raises ValueError on malformed text
+    def square(name):
+        if len(name) != 2 or name[0] not in 'ABC' or not '1' <= name[1] <= str(ROWS):
+            raise ValueError
+        return 'ABC'.index(name[0]) + (int(name[1]) - 1) * COLS
+
+    try:
+        if len(text) == 4 and text[1] == '*' and text[0] in PIECE_LETTERS[:3]:
+            return (DROP + PIECE_LETTERS.index(text[0])) << 4 | square(text[2:])
+        if len(text) == 5 and text[2] == '-':
+            return square(text[:2]) << 4 | square(text[3:])
+        raise ValueError
+    except ValueError:
+        raise ValueError('bad move: %r' % text) from None
+
+
+def perft(pos, depth):
+    # number of move sequences of the given length; positions where a lion
+    # has been captured end the game and are not expanded further
+    if depth == 0:
+        return 1
+    if pos.winner() is not None:
+        return 0
+    moves = pos.generate_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for mv in moves:
+        undo = pos.make_move(mv)
+        nodes += perft(pos, depth - 1)
+        pos.unmake_move(mv, undo)
+    return nodes
+
+
+def check_scores(pos):
+    material, bonus = pos.compute_scores()
+    assert (pos.material, pos.bonus) == (material, bonus), \
+        'incremental scores %d/%d, recomputed %d/%d' % (pos.material, pos.bonus, material, bonus)
+
+
+def evaluate(pos):
+    # material balance from player 1's (the computer's) point of view
+    bb = pos.bb
+    if not bb[LION]:
+        return WIN
+    if not bb[5 + LION]:
+        return -WIN
+    if CHECK_SCORES:
+        check_scores(pos)
+    return pos.material
+
+
+def evaluate_positional(pos):
+    # material plus a bonus for chicks advancing towards promotion
+    bb = pos.bb
+    if not bb[LION]:
+        return WIN
+    if not bb[5 + LION]:
+        return -WIN
+    if CHECK_SCORES:
+        check_scores(pos)
+    return pos.material + pos.bonus
+
+
+EXACT, LOWER, UPPER = 0, 1, 2
+NO_MOVE = 255
+MATE_BOUND = WIN - 1000
+
+
+class TranspositionTable:
+    # Two-way buckets of (key, data) pairs held in flat 64-bit arrays, so the
+    # memory footprint is fixed at 16 bytes per entry. data packs
+    # move | depth << 8 | bound << 14 | (score + 2**17) << 16 | generation << 34.
+    # Entries from older searches are replaced first, then the shallower one.
+    ENTRY_BYTES = 16
+
+    def __init__(self, size_mb=16):
+        entries = max(2, (size_mb << 20) // self.ENTRY_BYTES)
+        entries = 1 << (entries.bit_length() - 1)
+        self.mask = (entries - 1) & ~1
+        self.keys = array('Q', bytes(8 * entries))
+        self.data = array('Q', bytes(8 * entries))
+        self.generation = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def new_search(self):
+        self.generation = (self.generation + 1) & 255
+
+    def clear(self):
+        n = len(self.keys)
+        self.keys = array('Q', bytes(8 * n))
+        self.data = array('Q', bytes(8 * n))
+        self.generation = 0
+
+    def probe(self, key):
+        i = key & self.mask
+        keys = self.keys
+        if keys[i] == key:
+            return self.data[i]
+        if keys[i + 1] == key:
+            return self.data[i + 1]
+        return 0
+
+    def store(self, key, move, depth, bound, score):
+        i = key & self.mask
+        keys = self.keys
+        data = self.data
+        gen = self.generation
+        if keys[i] != key:
+            if keys[i + 1] == key:
+                i += 1
+            else:
+                d0 = data[i]
+                d1 = data[i + 1]
+                w0 = (d0 >> 8 & 63) - (0 if d0 >> 34 == gen else 64)
+                w1 = (d1 >> 8 & 63) - (0 if d1 >> 34 == gen else 64)
+                if w1 < w0:
+                    i += 1
+        if move is None:
+            move = data[i] & 255 if keys[i] == key else NO_MOVE
+        keys[i] = key
+        data[i] = move | min(depth, 63) << 8 | bound << 14 | (score + (1 << 17)) << 16 | gen << 34
+
+
+class SharedFlag:
+    # a threading.Event look-alike kept in one word of shared memory, so
+    # that other processes can check it
+    def __init__(self, words, index):
+        self.words = words
+        self.index = index
+
+    def is_set(self):
+        return self.words[self.index] != 0
+
+    def set(self):
+        self.words[self.index] = 1
+
+    def clear(self):
+        self.words[self.index] = 0
+
+
+class SharedTranspositionTable(TranspositionTable):
+    # The table in a multiprocessing.shared_memory block, shared by the
+    # processes of a Lazy SMP search (lazy_smp_search), which attach to it by
+    # name. Nothing is locked: an entry is the two words key ^ data and data,
+    # and a reader only accepts it if xoring them gives its key back, so an
+    # entry torn by two processes writing at once reads as a miss. Buckets
+    # and replacement are those of TranspositionTable. The header words hold
+    # the stop flag of the helpers, the generation and the entry count.
+    HEADER_WORDS = 8
+    STOP, GENERATION, ENTRIES = 0, 1, 2
+
+    def __init__(self, size_mb=16, name=None):
+        if name is None:
+            entries = max(2, (size_mb << 20) // self.ENTRY_BYTES)
+            entries = 1 << (entries.bit_length() - 1)
+            self.shm = SharedMemory(create=True, size=8 * (self.HEADER_WORDS + 2 * entries))
+            self.words = self.shm.buf.cast('Q')
+            self.words[self.ENTRIES] = entries
+        else:
+            self.shm = SharedMemory(name=name)
+            self.words = self.shm.buf.cast('Q')
+        self.owner = name is None
+        self.mask = (self.words[self.ENTRIES] - 1) & ~1
+        self.generation = self.words[self.GENERATION]
+        self.stop = SharedFlag(self.words, self.STOP)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def __len__(self):
+        return self.words[self.ENTRIES]
+
+    def new_search(self):
+        super().new_search()
+        self.words[self.GENERATION] = self.generation
+
+    def sync(self):
+        # take over the generation set by the process running the search
+        self.generation = self.words[self.GENERATION]
+
+    def clear(self):
+        n = self.words[self.ENTRIES]
+        self.shm.buf[8 * self.HEADER_WORDS:8 * (self.HEADER_WORDS + 2 * n)] = bytes(16 * n)
+        self.generation = self.words[self.GENERATION] = 0
+
+    def probe(self, key):
+        i = self.HEADER_WORDS + 2 * (key & self.mask)
+        words = self.words
+        data = words[i + 1]
+        if words[i] ^ data == key:
+            return data
+        data = words[i + 3]
+        if words[i + 2] ^ data == key:
+            return data
+        return 0
+
+    def store(self, key, move, depth, bound, score):
+        i = self.HEADER_WORDS + 2 * (key & self.mask)
+        words = self.words
+        gen = self.generation
+        d0 = words[i + 1]
+        if words[i] ^ d0 != key:
+            d1 = words[i + 3]
+            if words[i + 2] ^ d1 == key:
+                i += 2
+            else:
+                w0 = (d0 >> 8 & 63) - (0 if d0 >> 34 == gen else 64)
+                w1 = (d1 >> 8 & 63) - (0 if d1 >> 34 == gen else 64)
+                if w1 < w0:
+                    i += 2
+        old = words[i + 1]
+        if move is None:
+            move = old & 255 if words[i] ^ old == key else NO_MOVE
+        data = move | min(depth, 63) << 8 | bound << 14 | (score + (1 << 17)) << 16 | gen << 34
+        words[i] = key ^ data
+        words[i + 1] = data
+
+    def close(self):
+        # detach; the process that created the table also frees it
+        self.stop = None
+        self.words.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+ASPIRATION_WINDOW = 3
+MAX_DEPTH = 64
+
+SearchResult = namedtuple('SearchResult', 'score move depth nodes time')
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchStats:
+    # Counters for one search, filled in when passed to search() or
+    # parallel_search(); without one the searcher only counts nodes. The
+    # callback, if any, is called with the stats once the search is done.
+    # In a parallel search the counters cover the main process only, while
+    # nodes and the iterations include the workers' nodes.
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.reset()
+
+    def reset(self):
+        self.nodes = 0
+        self.evals = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.tt_cutoffs = 0
+        self.cutoffs = 0
+        self.first_cutoffs = 0
+        self.ply_nodes = [0] * (2 * MAX_DEPTH + 1)
+        self.iterations = []
+        self.result = None
+        self.pv = []
+
+    @property
+    def first_cutoff_rate(self):
+        # share of beta cutoffs caused by the first move searched
+        return self.first_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def branching(self):
+        # average number of children searched per node, for every ply
+        counts = [n for n in self.ply_nodes if n]
+        return [b / a for a, b in zip(counts, counts[1:])]
+
+    def add_iteration(self, result, pv):
+        self.iterations.append({'depth': result.depth, 'score': result.score, 'move': result.move,
+                                'nodes': result.nodes, 'time': result.time, 'pv': pv})
+
+    def finish(self, result):
+        self.result = result
+        if result is not None:
+            self.nodes = result.nodes
+        if self.iterations:
+            self.pv = self.iterations[-1]['pv']
+        if self.callback is not None:
+            self.callback(self)
+
+    def as_dict(self):
+        result = self.result
+        return {
+            'score': result.score if result else None,
+            'move': result.move if result else None,
+            'depth': result.depth if result else 0,
+            'time': result.time if result else 0.0,
+            'nodes': self.nodes,
+            'evals': self.evals,
+            'tt_probes': self.tt_probes,
+            'tt_hits': self.tt_hits,
+            'tt_cutoffs': self.tt_cutoffs,
+            'cutoffs': self.cutoffs,
+            'first_cutoff_rate': self.first_cutoff_rate,
+            'branching': self.branching(),
+            'iterations': self.iterations,
+            'pv': self.pv,
+        }
+
+    def __str__(self):
+        result = self.result
+        if result is None:
+            return 'no completed iteration, %d nodes' % self.nodes
+        return ('depth %d score %d nodes %d (%.0f/s) evals %d tt hits %d/%d first-move cutoffs %.0f%% '
+                'time %.3fs pv %s' % (result.depth, result.score, self.nodes, self.nodes / result.time
+                                      if result.time else 0, self.evals, self.tt_hits, self.tt_probes,
+                                      100 * self.first_cutoff_rate, result.time,
+                                      ' '.join(move_name(mv) for mv in self.pv)))
+
+
+def hash_move(pos, tt):
+    # the move stored in the transposition table for pos, if legal there
+    mirrored = pos.mkey < pos.key
+    entry = tt.probe(pos.mkey if mirrored else pos.key)
+    move = entry & 255 if entry else NO_MOVE
+    if move == NO_MOVE:
+        return None
+    if mirrored:
+        move = MIRROR_MOVE[move]
+    return move if pos.is_legal(move) else None
+
+
+def principal_variation(pos, tt, first, max_length=MAX_DEPTH):
+    # the best move followed by the hash moves stored for the positions it
+    # leads to, stopping at a missing or illegal move, the end of the game
+    # or a repeated position
+    pos = pos.copy()
+    pv = []
+    seen = set()
+    move = first
+    while move is not None and len(pv) < max_length and pos.key not in seen:
+        if not pos.is_legal(move):
+            break
+        seen.add(pos.key)
+        pos.make_move(move)
+        pv.append(move)
+        if tt is None or pos.winner() is not None:
+            break
+        move = hash_move(pos, tt)
+    return pv
+
+
+# Move ordering: lion captures and lion moves onto the far rank (try moves)
+# first, then the hash move, other captures by MVV/LVA on the PIECE_VALUES
+# scale, the two killer moves of the ply, and the remaining quiet moves by
+# their history score.
+ORDER_LION = 1 << 30
+ORDER_HASH = 1 << 29
+ORDER_CAPTURE = 1 << 27
+ORDER_KILLER = 1 << 25
+HISTORY_LIMIT = 1 << 24
+
+
+class Searcher:
+    def __init__(self, evaluate=evaluate, tt=None, time_ms=None, max_nodes=None, stop=None, ordering=True,
+                 stats=None):
+        self.evaluate = evaluate
+        self.stats = stats
+        self.tt = tt
+        self.time_ms = time_ms
+        self.max_nodes = max_nodes
+        self.stop = stop
+        self.ordering = ordering
+        self.killers = [[None, None] for _ in range(2 * MAX_DEPTH)]
+        self.history = [[0] * 256, [0] * 256]
+        self.deadline = None
+        self.limited = stop is not None
+        self.completed_depth = 0
+        self.root_move = None
+        self.nodes = 0
+
+    def check_budget(self):
+        # stop (a threading.Event) cancels at once, the time and node budget
+        # only apply once the first iteration has completed
+        if self.stop is not None and self.stop.is_set():
+            raise SearchTimeout
+        if not self.completed_depth:
+            return
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchTimeout
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            raise SearchTimeout
+
+    def negamax(self, pos, depth, ply, alpha, beta):
+        self.nodes += 1
+        stats = self.stats
+        if stats is not None:
+            stats.ply_nodes[ply] += 1
+        if self.limited and not self.nodes & 1023:
+            self.check_budget()
+        side = pos.side
+        if not pos.bb[side * 5 + LION]:
+            return ply - WIN, None
+        # games decided within a ply end here, before any move is generated
+        win = pos.winning_move()
+        if win is not None:
+            return WIN - ply - 1, win
+        if pos.bb[(1 - side) * 5 + LION] & PROMOTION_ZONE[1 - side]:
+            # a try that cannot be stopped
+            return ply - WIN, None
+        if depth == 0:
+            if stats is not None:
+                stats.evals += 1
+            score = self.evaluate(pos)
+            return (score if pos.side == 1 else -score), None
+
+        tt = self.tt
+        hash_move = None
+        if tt is not None:
+            mirrored = pos.mkey < pos.key
+            key = pos.mkey if mirrored else pos.key
+            entry = tt.probe(key)
+            if stats is not None:
+                stats.tt_probes += 1
+                stats.tt_hits += entry != 0
+            if entry:
+                move = entry & 255
+                if move != NO_MOVE:
+                    hash_move = MIRROR_MOVE[move] if mirrored else move
+                if ply and (entry >> 8 & 63) >= depth:
+                    score = (entry >> 16 & 0x3FFFF) - (1 << 17)
+                    if score > MATE_BOUND:
+                        score -= ply
+                    elif score < -MATE_BOUND:
+                        score += ply
+                    bound = entry >> 14 & 3
+                    if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+                        if stats is not None:
+                            stats.tt_cutoffs += 1
+                        return score, hash_move
+
+        moves = pos.generate_moves()
+        if not moves:
+            if stats is not None:
+                stats.evals += 1
+            score = self.evaluate(pos)
+            return (score if pos.side == 1 else -score), None
+        if not ply and self.root_move is not None:
+            hash_move = self.root_move
+        if self.ordering:
+            moves = self.order_moves(pos, moves, hash_move, ply)
+        elif hash_move is not None and hash_move in moves:
+            moves.remove(hash_move)
+            moves.insert(0, hash_move)
+
+        alpha_orig = alpha
+        best = -WIN - 1
+        best_move = None
+        for mv in moves:
+            undo = pos.make_move(mv)
+            score, _ = self.negamax(pos, depth - 1, ply + 1, -beta, -alpha)
+            pos.unmake_move(mv, undo)
+            score = -score
+            if score > best:
+                best = score
+                best_move = mv
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if not undo & 56:
+                            self.record_cutoff(pos.side, mv, depth, ply)
+                        if stats is not None:
+                            stats.cutoffs += 1
+                            stats.first_cutoffs += mv == moves[0]
+                        break
+
+        if tt is not None:
+            if best >= beta:
+                bound = LOWER
+            elif best > alpha_orig:
+                bound = EXACT
+            else:
+                bound = UPPER
+            stored = best
+            if stored > MATE_BOUND:
+                stored += ply
+            elif stored < -MATE_BOUND:
+                stored -= ply
+            tt.store(key, MIRROR_MOVE[best_move] if mirrored else best_move, depth, bound, stored)
+        return best, best_move
+
+    def order_moves(self, pos, moves, hash_move, ply):
+        side = pos.side
+        board = pos.mailbox()
+        opp = pos.occ[1 - side]
+        far_rank = PROMOTION_ZONE[side]
+        lion = side * 5 + LION
+        killer0, killer1 = self.killers[ply]
+        history = self.history[side]
+        scored = []
+        for mv in moves:
+            to = mv & 15
+            frm = mv >> 4
+            if opp >> to & 1:
+                victim = PIECE_VALUES[board[to] % 5]
+                if victim == PIECE_VALUES[LION]:
+                    score = ORDER_LION + 1
+                elif mv == hash_move:
+                    score = ORDER_HASH
+                else:
+                    score = ORDER_CAPTURE + victim * 2048 - PIECE_VALUES[board[frm] % 5]
+            elif frm < DROP and board[frm] == lion and far_rank >> to & 1:
+                score = ORDER_LION
+            elif mv == hash_move:
+                score = ORDER_HASH
+            elif mv == killer0:
+                score = ORDER_KILLER + 1
+            elif mv == killer1:
+                score = ORDER_KILLER
+            else:
+                score = history[mv]
+            scored.append((score, mv))
+        scored.sort(reverse=True)
+        return [mv for _, mv in scored]
+
+    def record_cutoff(self, side, move, depth, ply):
+        # a quiet move refuted the previous move: remember it as a killer
+        # for this ply and raise its history score
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        history = self.history[side]
+        history[move] += depth * depth
+        if history[move] > HISTORY_LIMIT:
+            for i in range(256):
+                history[i] >>= 1
+
+    def search_move(self, pos, move, depth, alpha, beta):
+        # score of one root move, from the root side's point of view
+        undo = pos.make_move(move)
+        score, _ = self.negamax(pos, depth - 1, 1, -beta, -alpha)
+        pos.unmake_move(move, undo)
+        return -score
+
+    def aspiration(self, pos, depth, guess):
+        if guess is None or abs(guess) > MATE_BOUND:
+            return self.negamax(pos, depth, 0, -WIN - 1, WIN + 1)
+        delta = ASPIRATION_WINDOW
+        alpha, beta = guess - delta, guess + delta
+        while True:
+            score, move = self.negamax(pos, depth, 0, alpha, beta)
+            if alpha < score < beta:
+                return score, move
+            delta *= 4
+            if delta > PIECE_VALUES[LION]:
+                return self.negamax(pos, depth, 0, -WIN - 1, WIN + 1)
+            if score <= alpha:
+                alpha = score - delta
+            else:
+                beta = score + delta
+
+    def iterate(self, pos, max_depth=MAX_DEPTH, start_depth=1):
+        # Iterative deepening from start_depth. The first iteration always
+        # completes unless stopped; after that the time/node budget is
+        # enforced and an unfinished iteration is thrown away in favour of
+        # the last completed one, which is None if stopped during the first.
+        # A new iteration is not started once half of the time budget is
+        # spent, since it would almost certainly not finish. A game already
+        # decided (a lion taken, a try made) is not searched: the result has
+        # no move and the score of a win or loss at depth 0.
+        start = time.perf_counter()
+        winner = pos.winner()
+        if winner is not None:
+            return SearchResult(WIN if winner == pos.side else -WIN, None, 0, 0, time.perf_counter() - start)
+        if self.time_ms is not None:
+            self.deadline = start + self.time_ms / 1000
+        pos = pos.copy()
+        result = None
+        for depth in range(start_depth, max_depth + 1):
+            try:
+                score, move = self.aspiration(pos, depth, result.score if result else None)
+            except SearchTimeout:
+                break
+            elapsed = time.perf_counter() - start
+            result = SearchResult(score, move, depth, self.nodes, elapsed)
+            if self.stats is not None:
+                self.stats.add_iteration(result, principal_variation(pos, self.tt, move, depth))
+            self.root_move = move
+            self.completed_depth = depth
+            self.limited = self.limited or self.deadline is not None or self.max_nodes is not None
+            if move is None or abs(score) > MATE_BOUND:
+                break
+            if self.time_ms is not None and elapsed * 2000 > self.time_ms:
+                break
+            if self.max_nodes is not None and self.nodes * 2 > self.max_nodes:
+                break
+        return result
+
+
+def ordering_report(pos, depth, evaluate=evaluate):
+    # node counts of a plain fixed-depth alpha-beta search in generation
+    # order and with the move ordering heuristics, without a hash table
+    counts = {}
+    for name, ordering in (('plain', False), ('ordered', True)):
+        searcher = Searcher(evaluate, ordering=ordering)
+        searcher.negamax(pos.copy(), depth, 0, -WIN - 1, WIN + 1)
+        counts[name] = searcher.nodes
+    counts['reduction'] = 1 - counts['ordered'] / counts['plain']
+    return counts
+
+
+def search(pos, max_depth=MAX_DEPTH, evaluate=evaluate, tt=None, time_ms=None, max_nodes=None, stop=None,
+           stats=None):
+    # Returns a SearchResult; score is from the side to move's point of view.
+    # The whole search makes and unmakes moves on a single private copy.
+    if tt is not None:
+        tt.new_search()
+    result = Searcher(evaluate, tt, time_ms, max_nodes, stop, stats=stats).iterate(pos, max_depth)
+    if stats is not None:
+        stats.finish(result)
+    return result
+
+
+class Ponder:
+    # Searches the position after the opponent's predicted move on a
+    # background thread while the opponent thinks. If the prediction comes
+    # true, hit() turns it into a normal timed search that counts the time
+    # already spent, keeping the searcher's killers and history; otherwise
+    # miss() stops it. The transposition table is the one of the regular
+    # search, so a miss still leaves its entries behind.
+
+    def __init__(self, pos, move, evaluate=evaluate, tt=None, max_depth=MAX_DEPTH, stats=None):
+        self.move = move
+        self.pos = pos.copy()
+        self.pos.make_move(move)
+        self.stop = threading.Event()
+        self.searcher = Searcher(evaluate, tt, stop=self.stop, stats=stats)
+        self.result = None
+        self.start = time.perf_counter()
+        if tt is not None:
+            tt.new_search()
+        self.thread = threading.Thread(target=self.run, args=(max_depth,), daemon=True)
+        self.thread.start()
+
+    def run(self, max_depth):
+        self.result = self.searcher.iterate(self.pos, max_depth)
+
+    def hit(self, time_ms=None):
+        # waits for the search to use up what is left of time_ms and returns
+        # its SearchResult; the stop event still cancels it
+        searcher = self.searcher
+        if time_ms is not None:
+            searcher.time_ms = time_ms
+            searcher.deadline = self.start + time_ms / 1000
+        self.thread.join()
+        if searcher.stats is not None:
+            searcher.stats.finish(self.result)
+        return self.result
+
+    def miss(self):
+        self.stop.set()
+        self.thread.join()
+
+
+# Mate solver. Looks for a forced win of the side to move within a number of
+# plies, trying only threats: moves after which the side to move would have
+# a winning move (a lion capture or a safe try) if it could move again. The
+# defender tries every reply. Depths grow by two plies at a time, so the
+# first win found is a shortest one among threat sequences.
+MATE_MAX_PLIES = 15
+MATE_MAX_NODES = 50000
+
+
+class MateSolver:
+    def __init__(self, max_nodes=MATE_MAX_NODES, stop=None):
+        self.max_nodes = max_nodes
+        self.stop = stop
+        self.nodes = 0
+        # key -> greatest depth known not to be enough, and proven wins
+        self.failed = {}
+        self.proven = {}
+
+    def count(self):
+        self.nodes += 1
+        if self.nodes > self.max_nodes or (self.stop is not None and not self.nodes & 1023
+                                           and self.stop.is_set()):
+            raise SearchTimeout
+
+    def attack(self, pos, plies):
+        # a move that wins within plies, or None
+        self.count()
+        win = pos.winning_move()
+        if win is not None:
+            return win
+        if plies < 3:
+            return None
+        key = pos.key
+        proven = self.proven.get(key)
+        if proven is not None and proven[0] <= plies:
+            return proven[1]
+        if self.failed.get(key, 0) >= plies:
+            return None
+        side = pos.side
+        for mv in pos.generate_moves():
+            undo = pos.make_move(mv)
+            if pos.winning_move(side) is not None and self.defend(pos, plies - 1):
+                pos.unmake_move(mv, undo)
+                self.proven[key] = (plies, mv)
+                return mv
+            pos.unmake_move(mv, undo)
+        self.failed[key] = plies
+        return None
+
+    def defend(self, pos, plies):
+        # whether every reply loses within plies
+        self.count()
+        if pos.winning_move() is not None:
+            return False
+        if pos.winner() is not None:
+            return True
+        for mv in pos.generate_moves():
+            undo = pos.make_move(mv)
+            lost = self.attack(pos, plies - 1) is not None
+            pos.unmake_move(mv, undo)
+            if not lost:
+                return False
+        return True
+
+
+def solve_mate(pos, max_plies=MATE_MAX_PLIES, max_nodes=MATE_MAX_NODES, stop=None):
+    # (move, plies) of a forced win for the side to move, or None if none
+    # was found within the limits
+    solver = MateSolver(max_nodes, stop)
+    pos = pos.copy()
+    if pos.winner() is not None:
+        return None
+    try:
+        for plies in range(1, max_plies + 1, 2):
+            move = solver.attack(pos, plies)
+            if move is not None:
+                return move, plies
+    except SearchTimeout:
+        pass
+    return None
+
+
+# Parallel root split. Depths below PARALLEL_MIN_DEPTH are searched serially;
+# from there on each iteration searches the previous best move in this
+# process to get an alpha bound (young brothers wait) and hands the other
+# root moves to a process pool. Every new task is submitted with the best
+# score found so far, and the executor's shared alpha value carries a better
+# one to the tasks already running: a worker that sees it rise above its own
+# bound starts its move again with the new one, its table keeping what it
+# has searched.
+PARALLEL_MIN_DEPTH = 4
+WORKER_TT_SIZE_MB = 16
+
+_worker_tt = None
+_worker_alpha = None
+
+
+class AlphaRaised(Exception):
+    pass
+
+
+class RootMoveSearcher(Searcher):
+    # a worker's search of one root move, given up (AlphaRaised) once the
+    # shared alpha is above the bound it was started with
+    def __init__(self, evaluate, tt, shared_alpha):
+        super().__init__(evaluate, tt)
+        self.shared_alpha = shared_alpha
+        self.alpha = None
+        self.limited = True
+
+    def check_budget(self):
+        if self.shared_alpha.value > self.alpha:
+            raise AlphaRaised
+        super().check_budget()
+
+
+def _init_worker(tt_size_mb, alpha):
+    global _worker_tt, _worker_alpha
+    _worker_tt = TranspositionTable(tt_size_mb)
+    _worker_alpha = alpha
+
+
+def _search_root_move(pos, move, depth, alpha, evaluate, time_ms):
+    searcher = RootMoveSearcher(evaluate, _worker_tt, _worker_alpha)
+    if time_ms is not None:
+        searcher.deadline = time.perf_counter() + time_ms / 1000
+        searcher.completed_depth = depth - 1
+    while True:
+        searcher.alpha = alpha
+        try:
+            # a search given up midway leaves its position half played
+            score = searcher.search_move(pos.copy(), move, depth, alpha, WIN + 1)
+        except SearchTimeout:
+            score = None
+        except AlphaRaised:
+            alpha = _worker_alpha.value
+            continue
+        return move, score, searcher.nodes
+
+
+def make_executor(workers=None, tt_size_mb=WORKER_TT_SIZE_MB):
+    # spawn rather than fork: callers such as the Tk game have threads
+    # running. The executor's alpha is the shared bound of the root split.
+    context = multiprocessing.get_context('spawn')
+    alpha = context.Value('q', -WIN - 1, lock=False)
+    executor = ProcessPoolExecutor(workers or os.cpu_count(), mp_context=context,
+                                   initializer=_init_worker, initargs=(tt_size_mb, alpha))
+    executor.alpha = alpha
+    return executor
+
+
+def parallel_search(pos, max_depth=MAX_DEPTH, evaluate=evaluate, tt=None, time_ms=None, stop=None,
+                    workers=None, executor=None, stats=None):
+    # Same contract as search(). workers=1 (or a single CPU) falls back to
+    # the serial search; an executor made by make_executor can be passed in
+    # to keep its worker processes and their transposition tables alive
+    # between searches.
+    workers = workers or os.cpu_count() or 1
+    if workers < 2 or max_depth < PARALLEL_MIN_DEPTH:
+        return search(pos, max_depth, evaluate, tt, time_ms, stop=stop, stats=stats)
+    start = time.perf_counter()
+    if tt is not None:
+        tt.new_search()
+    result = Searcher(evaluate, tt, time_ms, stop=stop, stats=stats).iterate(pos, PARALLEL_MIN_DEPTH - 1)
+    if result is not None and result.move is not None and abs(result.score) <= MATE_BOUND:
+        own_executor = executor is None
+        if own_executor:
+            executor = make_executor(workers)
+        try:
+            result = _parallel_iterate(pos.copy(), result, start, max_depth, evaluate, tt, time_ms, stop,
+                                       workers, executor, stats)
+        finally:
+            if own_executor:
+                executor.shutdown(cancel_futures=True)
+    if stats is not None:
+        stats.finish(result)
+    return result
+
+
+def _parallel_iterate(pos, result, start, max_depth, evaluate, tt, time_ms, stop, workers, executor, stats):
+    searcher = Searcher(evaluate, tt, time_ms, stop=stop, stats=stats)
+    if time_ms is not None:
+        searcher.deadline = start + time_ms / 1000
+    searcher.completed_depth = result.depth
+    searcher.limited = True
+    nodes = result.nodes
+    moves = pos.generate_moves()
+    for depth in range(result.depth + 1, max_depth + 1):
+        best_move = result.move
+        searcher.nodes = 0
+        try:
+            best = searcher.search_move(pos, best_move, depth, -WIN - 1, WIN + 1)
+        except SearchTimeout:
+            break
+        nodes += searcher.nodes
+        executor.alpha.value = best
+        rest = iter([mv for mv in moves if mv != best_move])
+        futures = {}
+        timed_out = False
+
+        def submit():
+            mv = next(rest, None)
+            if mv is None:
+                return
+            remaining = None
+            if time_ms is not None:
+                remaining = max(0, time_ms - (time.perf_counter() - start) * 1000)
+            futures[executor.submit(_search_root_move, pos, mv, depth, best, evaluate, remaining)] = mv
+
+        for _ in range(workers):
+            submit()
+        while futures and not timed_out:
+            done, _ = wait(futures, timeout=0.05, return_when=FIRST_COMPLETED)
+            if (stop is not None and stop.is_set()) or \
+                    (searcher.deadline is not None and time.perf_counter() >= searcher.deadline):
+                timed_out = True
+            for f in done:
+                del futures[f]
+                mv, score, n = f.result()
+                nodes += n
+                if score is None:
+                    timed_out = True
+                elif score > best:
+                    best, best_move = score, mv
+                    executor.alpha.value = best
+                if not timed_out:
+                    submit()
+        if timed_out:
+            for f in futures:
+                f.cancel()
+            break
+        result = SearchResult(best, best_move, depth, nodes, time.perf_counter() - start)
+        if stats is not None:
+            stats.add_iteration(result, principal_variation(pos, tt, best_move, depth))
+        if abs(best) > MATE_BOUND:
+            break
+        if time_ms is not None and result.time * 2000 > time_ms:
+            break
+    return result
+
+
+# Lazy SMP: helper processes search the same root as the main one, each
+# starting its iterative deepening at a different depth (1 + helper % 3) so
+# that they spread over different parts of the tree, and share what they
+# find through a SharedTranspositionTable. Only the main search's result is
+# used; the helpers are stopped when it returns.
+_smp_tt = None
+
+
+def _init_smp_worker(name):
+    global _smp_tt
+    _smp_tt = SharedTranspositionTable(name=name)
+
+
+def _lazy_smp_helper(pos, helper, max_depth, evaluate):
+    _smp_tt.sync()
+    searcher = Searcher(evaluate, _smp_tt, stop=_smp_tt.stop)
+    searcher.iterate(pos, max_depth, min(max_depth, 1 + helper % 3))
+    return searcher.nodes
+
+
+def make_smp_executor(tt, helpers=None):
+    # helper processes attached to the shared table tt
+    return ProcessPoolExecutor(helpers or max(1, (os.cpu_count() or 1) - 1),
+                               mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_smp_worker, initargs=(tt.name,))
+
+
+def lazy_smp_search(pos, max_depth=MAX_DEPTH, evaluate=evaluate, tt=None, time_ms=None, stop=None,
+                    workers=None, executor=None, stats=None):
+    # Same contract as search(), searching with workers processes in all:
+    # this one and workers - 1 helpers. tt must be a SharedTranspositionTable
+    # (otherwise, or with workers=1, this is the serial search) and executor,
+    # if given, one made by make_smp_executor for it. nodes in the result
+    # include the helpers' nodes.
+    workers = workers or os.cpu_count() or 1
+    if workers < 2 or not isinstance(tt, SharedTranspositionTable):
+        return search(pos, max_depth, evaluate, tt, time_ms, stop=stop, stats=stats)
+    tt.new_search()
+    tt.stop.clear()
+    own_executor = executor is None
+    if own_executor:
+        executor = make_smp_executor(tt, workers - 1)
+    helpers = [executor.submit(_lazy_smp_helper, pos, helper, max_depth, evaluate) for helper in range(1, workers)]
+    try:
+        result = Searcher(evaluate, tt, time_ms, stop=stop, stats=stats).iterate(pos, max_depth)
+    finally:
+        tt.stop.set()
+        helper_nodes = sum(f.result() for f in helpers)
+        if own_executor:
+            executor.shutdown()
+    if result is not None:
+        result = result._replace(nodes=result.nodes + helper_nodes)
+    if stats is not None:
+        stats.finish(result)
+    return result
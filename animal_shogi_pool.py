@@ -0,0 +1,175 @@
+# coding: utf-8
+
+# Client side of animal_shogi_usi.py: a pool of long-lived engine processes
+# shared by many games.
+#
+# EnginePool starts its engines once and hands each best_move() call to an
+# idle one, so a request pays for the search only. Calls may come from any
+# number of threads; they queue while every engine is busy. A game that
+# passes its id is sent back to the engine it used last when that one is
+# free, whose table still holds that game's positions; the pool remembers
+# the last MAX_GAMES games, and forget() drops a finished one. An engine that
+# dies is replaced and the request fails with EngineError.
+
+import os
+import subprocess
+import sys
+import threading
+from collections import OrderedDict, namedtuple
+
+from animal_shogi_engine import WIN, parse_move
+
+ENGINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'animal_shogi_usi.py')
+# games whose last engine is remembered, least recently used dropped first
+MAX_GAMES = 1024
+
+# move is the engine's one-byte move, None when the side to move has lost;
+# score (from the side to move's point of view, on the search's scale where
+# a win in n plies is WIN - n), depth and pv (move text) are those of the
+# engine's last info line, None and [] without one
+BestMove = namedtuple('BestMove', 'move score depth pv')
+
+
+class EngineError(Exception):
+    pass
+
+
+class EngineProcess:
+    def __init__(self, command=None, hash_mb=None, threads=None):
+        self.alive = True
+        self.proc = subprocess.Popen(command or [sys.executable, ENGINE], stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE, text=True, bufsize=1)
+        self.send('usi')
+        self.read_until('usiok')
+        if hash_mb is not None:
+            self.send('setoption name Hash value %d' % hash_mb)
+        if threads is not None:
+            self.send('setoption name Threads value %d' % threads)
+        self.send('isready')
+        self.read_until('readyok')
+
+    def send(self, line):
+        try:
+            self.proc.stdin.write(line + '\n')
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError):
+            self.alive = False
+            raise EngineError('engine process exited') from None
+
+    def read_until(self, token):
+        # the lines up to and including the first one starting with token
+        lines = []
+        while True:
+            line = self.proc.stdout.readline()
+            if not line:
+                self.alive = False
+                raise EngineError('engine process exited')
+            line = line.strip()
+            lines.append(line)
+            if line.split(' ', 1)[0] == token:
+                return lines
+
+    def best_move(self, sfen=None, moves=(), time_ms=None, depth=None):
+        # the engine's move in the position given as SFEN (None for the
+        # initial one) followed by moves in move_name() text
+        position = 'position ' + ('sfen ' + sfen if sfen else 'startpos')
+        if moves:
+            position += ' moves ' + ' '.join(moves)
+        self.send(position)
+        # isready makes sure a bad position is reported before searching it
+        self.send('isready')
+        for line in self.read_until('readyok'):
+            if line.startswith('info string error '):
+                raise EngineError(line[len('info string error '):])
+        go = 'go'
+        if time_ms is not None:
+            go += ' movetime %d' % time_ms
+        if depth is not None:
+            go += ' depth %d' % depth
+        self.send(go)
+        lines = self.read_until('bestmove')
+        text = lines[-1].split()[1]
+        score = found_depth = None
+        pv = []
+        for line in lines:
+            words = line.split()
+            if words[0] != 'info' or 'score' not in words:
+                continue
+            i = words.index('score')
+            score = int(words[i + 2])
+            if words[i + 1] == 'mate':
+                score = WIN - score if score > 0 else -WIN - score
+            found_depth = int(words[words.index('depth') + 1]) if 'depth' in words else None
+            pv = words[words.index('pv') + 1:] if 'pv' in words else []
+        return BestMove(None if text == 'resign' else parse_move(text), score, found_depth, pv)
+
+    def close(self):
+        try:
+            self.send('quit')
+            self.proc.stdin.close()
+            self.proc.wait(timeout=5)
+        except (EngineError, subprocess.TimeoutExpired):
+            self.proc.kill()
+            self.proc.wait()
+
+
+class EnginePool:
+    def __init__(self, size=None, command=None, hash_mb=None, threads=None):
+        self.options = (command, hash_mb, threads)
+        self.engines = [EngineProcess(*self.options) for _ in range(size or os.cpu_count() or 1)]
+        self.idle = list(self.engines)
+        self.last = OrderedDict()
+        self.ready = threading.Condition()
+
+    def acquire(self, game=None):
+        with self.ready:
+            while not self.idle:
+                self.ready.wait()
+            engine = self.last.get(game)
+            if engine not in self.idle:
+                engine = self.idle[-1]
+            self.idle.remove(engine)
+            return engine
+
+    def release(self, engine, game=None):
+        with self.ready:
+            self.idle.append(engine)
+            if game is not None:
+                self.last[game] = engine
+                self.last.move_to_end(game)
+                if len(self.last) > MAX_GAMES:
+                    self.last.popitem(last=False)
+            self.ready.notify()
+
+    def forget(self, game):
+        # drops a finished game's engine preference
+        with self.ready:
+            self.last.pop(game, None)
+
+    def best_move(self, sfen=None, moves=(), time_ms=None, depth=None, game=None):
+        # as EngineProcess.best_move, on the first free engine
+        engine = self.acquire(game)
+        try:
+            return engine.best_move(sfen, moves, time_ms, depth)
+        except EngineError:
+            if engine.alive:
+                raise
+            engine.close()
+            with self.ready:
+                for other in [g for g, e in self.last.items() if e is engine]:
+                    del self.last[other]
+            index = self.engines.index(engine)
+            engine = self.engines[index] = EngineProcess(*self.options)
+            raise
+        finally:
+            self.release(engine, game)
+
+    def close(self):
+        for engine in self.engines:
+            engine.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
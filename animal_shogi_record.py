@@ -0,0 +1,144 @@
+# coding: utf-8
+
+# Append-only game record files.
+#
+# A file starts with an 8 byte header ('ASGR', version, 3 reserved bytes)
+# and is followed by records, each
+#
+#   result (1 byte): the winning side, DRAW or UNFINISHED
+#   start length (1 byte): 0 for the initial position with player 1 to move
+#   move count (2 bytes, little endian)
+#   start position as SFEN text (Position.sfen), if any
+#   one byte per move, (from << 4) | to as in the engine
+#
+# Records are only ever appended, so a writer can be killed at any time: a
+# record cut short at the end of the file is ignored by the reader and
+# dropped by the next writer before it appends. The reader streams, holding
+# one record at a time.
+
+import argparse
+import struct
+import sys
+from collections import namedtuple
+
+from animal_shogi_engine import Position, move_name
+
+MAGIC = b'ASGR'
+VERSION = 1
+HEADER = struct.Struct('<4sB3x')
+RECORD = struct.Struct('<BBH')
+DRAW = 2
+UNFINISHED = 3
+
+# result is 0 or 1 for the winner, DRAW or UNFINISHED; start is the SFEN of
+# the starting position, None for the initial one
+GameRecord = namedtuple('GameRecord', 'moves result start')
+
+
+class RecordWriter:
+    def __init__(self, path):
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(HEADER.pack(MAGIC, VERSION))
+        else:
+            # a record cut short by a killed writer is dropped, or every
+            # record after it would be read at the wrong offset
+            with open(path, 'rb') as f:
+                try:
+                    _check_header(f, path)
+                except ValueError:
+                    self.file.close()
+                    raise
+                end = _records_end(f)
+            if end != self.file.tell():
+                self.file.truncate(end)
+                self.file.seek(end)
+
+    def write(self, moves, result=UNFINISHED, start=None):
+        start = start.encode('ascii') if start else b''
+        self.file.write(RECORD.pack(result, len(start), len(moves)) + start + bytes(moves))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _check_header(f, path):
+    header = f.read(HEADER.size)
+    if len(header) != HEADER.size or HEADER.unpack(header) != (MAGIC, VERSION):
+        raise ValueError('%s is not an Animal Shogi game record file' % path)
+
+
+def _records_end(f):
+    # offset of the end of the last complete record, f being just past the
+    # header
+    end = f.tell()
+    while True:
+        head = f.read(RECORD.size)
+        if len(head) < RECORD.size:
+            return end
+        _, start_length, count = RECORD.unpack(head)
+        if len(f.read(start_length + count)) < start_length + count:
+            return end
+        end = f.tell()
+
+
+def read_records(path):
+    # yields the GameRecords of the file in order
+    with open(path, 'rb') as f:
+        _check_header(f, path)
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                return
+            result, start_length, count = RECORD.unpack(head)
+            body = f.read(start_length + count)
+            if len(body) < start_length + count:
+                return
+            start = body[:start_length].decode('ascii') if start_length else None
+            yield GameRecord(list(body[start_length:]), result, start)
+
+
+def last_record(path):
+    record = None
+    for record in read_records(path):
+        pass
+    return record
+
+
+def start_position(record):
+    return Position.from_sfen(record.start) if record.start else Position.initial()
+
+
+def replay(record):
+    # the position at the end of the game; raises ValueError if a move is
+    # not legal
+    pos = start_position(record)
+    for move in record.moves:
+        if pos.winner() is not None or not pos.is_legal(move):
+            raise ValueError('illegal move %d in game record' % move)
+        pos.make_move(move)
+    return pos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Print the games of an Animal Shogi game record file.')
+    parser.add_argument('path', help='game record file')
+    args = parser.parse_args(argv)
+    results = {0: '1-0', 1: '0-1', DRAW: 'draw', UNFINISHED: '*'}
+    for number, record in enumerate(read_records(args.path), 1):
+        print('%d. [%s] %s %s' % (number, start_position(record).sfen(), ' '.join(map(move_name, record.moves)),
+                                  results.get(record.result, '?')))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+# coding: utf-8
+
+# Engine-vs-engine self-play on every core.
+#
+# Each game opens with a few random plies (seeded per game, so a run is
+# reproducible) and then both sides play the fixed-depth search. Games are
+# written to the output in game order as soon as they finish, either as one
+# JSON line each or appended to a game record file (animal_shogi_record.py);
+# moves use the engine's one-byte (from << 4) | to encoding. A game is drawn
+# on the fourth occurrence of a position or after --max-plies plies.
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from animal_shogi_engine import Position, TranspositionTable, evaluate, evaluate_positional, search
+from animal_shogi_record import DRAW, RecordWriter
+
+EVALUATORS = {'material': evaluate, 'positional': evaluate_positional}
+TT_SIZE_MB = 4
+REPETITIONS = 4
+REPORT_SECONDS = 5
+
+_tt = None
+
+
+def _init_worker(tt_size_mb):
+    global _tt
+    _tt = TranspositionTable(tt_size_mb)
+
+
+def play_game(game, seed, depth, evaluator, random_plies, max_plies, tt=None):
+    rng = random.Random(seed)
+    evaluate = EVALUATORS[evaluator]
+    pos = Position.initial()
+    seen = {pos.key: 1}
+    moves = []
+    winner = None
+    while len(moves) < max_plies:
+        legal = pos.generate_moves()
+        if not legal:
+            winner = 1 - pos.side
+            break
+        if len(moves) < random_plies:
+            move = rng.choice(legal)
+        else:
+            move = search(pos, depth, evaluate, tt).move
+        pos.make_move(move)
+        moves.append(move)
+        winner = pos.winner()
+        if winner is not None:
+            break
+        seen[pos.key] = seen.get(pos.key, 0) + 1
+        if seen[pos.key] >= REPETITIONS:
+            break
+    if tt is not None:
+        tt.clear()
+    return {'game': game, 'seed': seed, 'winner': winner, 'plies': len(moves), 'moves': moves}
+
+
+def _play_game(args):
+    return play_game(*args, tt=_tt)
+
+
+class JsonWriter:
+    def __init__(self, out):
+        self.out = out
+
+    def write(self, record):
+        self.out.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def flush(self):
+        self.out.flush()
+
+
+class RecordFileWriter:
+    def __init__(self, path):
+        self.records = RecordWriter(path)
+
+    def write(self, record):
+        self.records.write(record['moves'], DRAW if record['winner'] is None else record['winner'])
+
+    def flush(self):
+        self.records.flush()
+
+    def close(self):
+        self.records.close()
+
+
+def run(writer, games, workers=None, depth=4, evaluator='positional', random_plies=4, max_plies=200,
+        seed=0, log=print):
+    # Plays the games across a process pool and hands each one to
+    # writer.write() as it completes. Returns the number of games played per
+    # second.
+    workers = workers or os.cpu_count() or 1
+    tasks = [(i, seed + i, depth, evaluator, random_plies, max_plies) for i in range(games)]
+    chunksize = max(1, min(16, games // (workers * 8)))
+    wins = [0, 0, 0]
+    start = last = time.perf_counter()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(TT_SIZE_MB,)) as executor:
+        for done, record in enumerate(executor.map(_play_game, tasks, chunksize=chunksize), 1):
+            writer.write(record)
+            wins[2 if record['winner'] is None else record['winner']] += 1
+            now = time.perf_counter()
+            if now - last >= REPORT_SECONDS:
+                writer.flush()
+                log('%d/%d games, %.1f games/s' % (done, games, done / (now - start)))
+                last = now
+    elapsed = time.perf_counter() - start
+    rate = games / elapsed if elapsed else 0.0
+    log('%d games in %.1fs: %.1f games/s on %d workers (player 1 %d, player 2 %d, draws %d)'
+        % (games, elapsed, rate, workers, wins[0], wins[1], wins[2]))
+    return rate
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play engine-vs-engine Animal Shogi games.')
+    parser.add_argument('--games', type=int, default=1000, help='number of games (default: %(default)s)')
+    parser.add_argument('--out', default=None,
+                        help='output file, - for stdout (default: selfplay.jsonl or selfplay.asgr)')
+    parser.add_argument('--format', choices=('jsonl', 'record'), default='jsonl',
+                        help='JSON lines or a binary game record file, which is appended to')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all CPUs)')
+    parser.add_argument('--depth', type=int, default=4, help='search depth per move (default: %(default)s)')
+    parser.add_argument('--eval', choices=sorted(EVALUATORS), default='positional', help='evaluation function')
+    parser.add_argument('--random-plies', type=int, default=4, help='random opening plies (default: %(default)s)')
+    parser.add_argument('--max-plies', type=int, default=200, help='plies before a draw (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game')
+    args = parser.parse_args(argv)
+    log = lambda msg: print(msg, file=sys.stderr)
+    settings = (args.games, args.workers, args.depth, args.eval, args.random_plies, args.max_plies, args.seed, log)
+    if args.format == 'record':
+        writer = RecordFileWriter(args.out or 'selfplay.asgr')
+        try:
+            run(writer, *settings)
+        finally:
+            writer.close()
+    elif args.out == '-':
+        run(JsonWriter(sys.stdout), *settings)
+    else:
+        with open(args.out or 'selfplay.jsonl', 'w') as out:
+            run(JsonWriter(out), *settings)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
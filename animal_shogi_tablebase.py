@@ -0,0 +1,527 @@
+# coding: utf-8
+
+# Retrograde-analysis tablebase for Animal Shogi.
+#
+# Index: positions are normalised so that the side to move is player 0 (a
+# position with player 1 to move is rotated 180 degrees and the colours are
+# swapped). The index is then
+#
+#   lion pair (12 * 11) * REST
+#   + offset of k, the number of other pieces on the board
+#   + rank of the k occupied squares among the 10 non-lion squares
+#     * number of piece/hand combinations for k
+#   + rank of (piece code on each occupied square, side-to-move hand counts)
+#
+# which is a perfect index over all 1,567,925,964 placements.
+#
+# File: a 16 byte header ('ASTB', version, complete flag, entry count)
+# followed by one byte per index: 0 is a draw (or not yet known), otherwise
+# the value is distance + 1 where distance is the number of plies to the
+# end of the game; odd distances are wins for the side to move, even ones
+# losses. The longest distance that fits is 254 plies.
+#
+# Building: every position where the side to move can take the enemy lion
+# is a win in 1, and every position without a legal move or where the enemy
+# lion has made a try (stands on the side to move's home rank out of reach)
+# a loss in 0. Pass d
+# then finds the positions at distance d in the file, generates their
+# predecessors with un-moves, and marks them as wins in d + 1 (after a
+# loss) or, once every move has been checked to lead to a known win, as
+# losses in d + 1. Passes are split in index ranges over a process pool and
+# progress is checkpointed after every batch, so an interrupted build
+# resumes where it stopped.
+#
+# Memory: the table is a memory-mapped file (1.5 GB of file-backed page
+# cache, not process memory). Each process holds the index tables (30 MB)
+# plus the results of one task; with the default chunk of 20,000 positions
+# a process peaked at 61 MB RSS on a chunk where every position had to be
+# expanded, so plan for about (workers + 1) * 64 MB plus the page cache.
+
+import argparse
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from math import comb
+
+from animal_shogi_engine import (ATTACKS, BITS, CHICK, COLS, ELEPHANT, FULL, GIRAFFE, HEN, LION, ROWS, SQUARES,
+                                 Position)
+
+HEADER = struct.Struct('<4sBBxxQ')
+MAGIC = b'ASTB'
+VERSION = 2
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'animal_shogi.tb')
+MAX_DISTANCE = 254
+
+# piece codes used by the index: type * 2 + owner
+CODE_TYPES = (CHICK, HEN, ELEPHANT, GIRAFFE)
+CODE_KIND = (0, 0, 1, 2)  # chick and hen share the chick hand slot
+
+
+def _rotate(mask):
+    return int(format(mask, '012b')[::-1], 2)
+
+
+ROTATE = [_rotate(mask) for mask in range(1 << SQUARES)]
+
+
+def _combos(k):
+    combos = []
+    for seq in product(range(8), repeat=k):
+        counts = [0, 0, 0]
+        for code in seq:
+            counts[CODE_KIND[code >> 1]] += 1
+        if max(counts) > 2:
+            continue
+        for held in product(*(range(3 - n) for n in counts)):
+            combos.append((seq, held))
+    return combos
+
+
+COMBOS = [_combos(k) for k in range(7)]
+COMBO_INDEX = [{combo: i for i, combo in enumerate(combos)} for combos in COMBOS]
+SUBSETS = [[mask for mask in range(1 << 10) if mask.bit_count() == k] for k in range(7)]
+SUBSET_INDEX = {mask: i for subsets in SUBSETS for i, mask in enumerate(subsets)}
+OFFSETS = []
+REST = 0
+for _k in range(7):
+    OFFSETS.append(REST)
+    REST += comb(10, _k) * len(COMBOS[_k])
+SIZE = 12 * 11 * REST
+FREE = [[tuple(sq for sq in range(SQUARES) if sq != a and sq != b) for b in range(SQUARES)]
+        for a in range(SQUARES)]
+
+
+def normalized(bb, hands, side):
+    if side:
+        return [ROTATE[m] for m in bb[5:] + bb[:5]], (hands & 63) << 6 | hands >> 6
+    return bb, hands
+
+
+def index_of(bb, hands, side):
+    bb, hands = normalized(bb, hands, side)
+    a = bb[LION].bit_length() - 1
+    b = bb[5 + LION].bit_length() - 1
+    lions = a * 11 + (b if b < a else b - 1)
+    codes = {}
+    for code in range(8):
+        t = CODE_TYPES[code >> 1]
+        for sq in BITS[bb[(code & 1) * 5 + t]]:
+            codes[sq] = code
+    mask = 0
+    seq = []
+    for i, sq in enumerate(FREE[a][b]):
+        code = codes.get(sq)
+        if code is not None:
+            mask |= 1 << i
+            seq.append(code)
+    k = len(seq)
+    held = (hands & 3, hands >> 2 & 3, hands >> 4 & 3)
+    return (lions * REST + OFFSETS[k] + SUBSET_INDEX[mask] * len(COMBOS[k])
+            + COMBO_INDEX[k][(tuple(seq), held)])
+
+
+def position_at(index):
+    # the position (player 0 to move) with the given index
+    lions, rest = divmod(index, REST)
+    a, b = divmod(lions, 11)
+    if b >= a:
+        b += 1
+    k = 0
+    while k < 6 and rest >= OFFSETS[k + 1]:
+        k += 1
+    subset, combo = divmod(rest - OFFSETS[k], len(COMBOS[k]))
+    seq, held = COMBOS[k][combo]
+    bb = [0] * 10
+    bb[LION] = 1 << a
+    bb[5 + LION] = 1 << b
+    free = FREE[a][b]
+    counts = [0, 0, 0]
+    for i, code in zip(BITS[SUBSETS[k][subset]], seq):
+        bb[(code & 1) * 5 + CODE_TYPES[code >> 1]] |= 1 << free[i]
+        counts[CODE_KIND[code >> 1]] += 1
+    hands = 0
+    for kind in range(3):
+        hands |= held[kind] << (kind * 2) | (2 - counts[kind] - held[kind]) << (6 + kind * 2)
+    occ = [sum(bb[:5]), sum(bb[5:])]
+    return Position(bb, occ, hands, 0)
+
+
+def captures_lion(pos):
+    side = pos.side
+    target = pos.bb[(1 - side) * 5 + LION]
+    base = side * 5
+    for ptype in range(5):
+        attacks = ATTACKS[base + ptype]
+        for sq in BITS[pos.bb[base + ptype]]:
+            if attacks[sq] & target:
+                return True
+    return False
+
+
+def predecessors(pos):
+    # Positions (player 1 to move) from which player 1 reaches pos, which
+    # must have player 0 to move, as (bb, occ, hands) triples.
+    bb = pos.bb
+    occ = pos.occ
+    hands = pos.hands
+    empty = FULL & ~(occ[0] | occ[1])
+    preds = []
+    for ptype in (CHICK, ELEPHANT, GIRAFFE, LION, HEN):
+        for to in BITS[bb[5 + ptype]]:
+            to_bit = 1 << to
+            if ptype != LION and ptype != HEN:
+                # un-drop
+                pbb = list(bb)
+                pbb[5 + ptype] ^= to_bit
+                preds.append((pbb, [occ[0], occ[1] ^ to_bit], hands + (1 << (6 + ptype * 2))))
+            movers = [ptype]
+            if ptype == HEN and to >= COLS * (ROWS - 1):
+                movers.append(CHICK)
+            elif ptype == CHICK and to >= COLS * (ROWS - 1):
+                # a chick moving onto the last rank would have promoted
+                continue
+            for before in movers:
+                attacks = ATTACKS[5 + before]
+                for frm in BITS[empty]:
+                    if before == CHICK and frm != to - COLS:
+                        continue
+                    if not attacks[frm] & to_bit:
+                        continue
+                    pbb = list(bb)
+                    pbb[5 + ptype] ^= to_bit
+                    pbb[5 + before] |= 1 << frm
+                    pocc1 = occ[1] ^ to_bit ^ (1 << frm)
+                    preds.append((pbb, [occ[0], pocc1], hands))
+                    # un-capture: a piece from player 1's hand goes back to player 0
+                    for kind, types in ((CHICK, (CHICK, HEN)), (ELEPHANT, (ELEPHANT,)), (GIRAFFE, (GIRAFFE,))):
+                        if hands >> (6 + kind * 2) & 3:
+                            for captured in types:
+                                cbb = list(pbb)
+                                cbb[captured] |= to_bit
+                                preds.append((cbb, [occ[0] | to_bit, pocc1], hands - (1 << (6 + kind * 2))))
+    return preds
+
+
+def _sample_games(samples, rng):
+    # positions with both lions on the board from random games, both sides
+    # to move, samples in all
+    positions = []
+    while len(positions) < samples:
+        pos = Position.initial(rng.randrange(2))
+        for _ in range(80):
+            if pos.winner() is not None or len(positions) >= samples:
+                break
+            moves = pos.generate_moves()
+            if not moves:
+                break
+            positions.append(pos.copy())
+            pos.make_move(rng.choice(moves))
+    return positions
+
+
+def self_check(samples=1000, seed=1):
+    # Checks the index and the un-moves on sampled positions; returns a
+    # list of failures, empty when all is well:
+    #   - position_at(index_of(...)) gives back the normalised position and
+    #     index_of(position_at(i)) == i for random indices
+    #   - every predecessor of a position has a move leading to it, and every
+    #     position a non-capturing move leads to has the mover among its
+    #     predecessors
+    rng = random.Random(seed)
+    failures = []
+    for _ in range(samples):
+        i = rng.randrange(SIZE)
+        pos = position_at(i)
+        found = index_of(pos.bb, pos.hands, 0)
+        if found != i:
+            failures.append('index %d comes back as %d' % (i, found))
+    for pos in _sample_games(samples, rng):
+        bb, hands = normalized(pos.bb, pos.hands, pos.side)
+        back = position_at(index_of(pos.bb, pos.hands, pos.side))
+        if back.bb != bb or back.hands != hands:
+            failures.append('%s does not survive the index round trip' % pos.sfen())
+        if pos.side == 0:
+            for pbb, pocc, phands in predecessors(pos):
+                pred = Position(pbb, pocc, phands, 1)
+                if pocc != [sum(pbb[:5]), sum(pbb[5:])]:
+                    failures.append('predecessor %s of %s has wrong occupancy' % (pred.sfen(), pos.sfen()))
+                    continue
+                children = []
+                for mv in pred.generate_moves():
+                    undo = pred.make_move(mv)
+                    children.append(pred.key)
+                    pred.unmake_move(mv, undo)
+                if pos.key not in children:
+                    failures.append('predecessor %s has no move to %s' % (pred.sfen(), pos.sfen()))
+        else:
+            for mv in pos.generate_moves():
+                undo = pos.make_move(mv)
+                # a lion capture ends the game and has no un-move
+                preds = None
+                if pos.bb[LION]:
+                    preds = [Position(pbb, pocc, phands, 1).key for pbb, pocc, phands in predecessors(pos)]
+                child = pos.sfen()
+                pos.unmake_move(mv, undo)
+                if preds is not None and pos.key not in preds:
+                    failures.append('%s is missing from the predecessors of %s' % (pos.sfen(), child))
+    return failures
+
+
+def _child_values(pos, table):
+    # yields the value of every child from the child's side to move; a lion
+    # capture yields None
+    for mv in pos.generate_moves():
+        undo = pos.make_move(mv)
+        if not pos.bb[pos.side * 5 + LION]:
+            pos.unmake_move(mv, undo)
+            yield None
+            continue
+        value = table[HEADER.size + index_of(pos.bb, pos.hands, pos.side)]
+        pos.unmake_move(mv, undo)
+        yield value
+
+
+def _open_table(path, write=False):
+    f = open(path, 'r+b' if write else 'rb')
+    return f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if write else mmap.ACCESS_READ)
+
+
+_tables = {}
+
+
+def _shared_table(path):
+    # workers map the file read-only; MAP_SHARED keeps them coherent with
+    # the builder's writes
+    if path not in _tables:
+        _tables[path] = _open_table(path)
+    return _tables[path][1]
+
+
+def _seed_chunk(lo, hi):
+    wins = array('I')
+    losses = array('I')
+    for index in range(lo, hi):
+        pos = position_at(index)
+        if captures_lion(pos):
+            wins.append(index)
+        elif pos.winner() == 1 or not pos.generate_moves():
+            losses.append(index)
+    return wins, losses
+
+
+def _retro_chunk(path, lo, hi, distance):
+    # expands every position at this distance whose index is in [lo, hi)
+    table = _shared_table(path)
+    needle = bytes([distance + 1])
+    found = array('I')
+    seen = set()
+    expanded = 0
+    at = table.find(needle, HEADER.size + lo, HEADER.size + hi)
+    while at != -1:
+        expanded += 1
+        for pbb, pocc, phands in predecessors(position_at(at - HEADER.size)):
+            pred = index_of(pbb, phands, 1)
+            if pred in seen or table[HEADER.size + pred]:
+                continue
+            seen.add(pred)
+            if distance % 2 == 0:
+                # the predecessor can move into a lost position
+                found.append(pred)
+                continue
+            pos = Position(pbb, pocc, phands, 1)
+            if all(v and v % 2 == 0 and v <= distance + 1 for v in _child_values(pos, table)):
+                found.append(pred)
+        at = table.find(needle, at + 1, HEADER.size + hi)
+    return expanded, found
+
+
+class Builder:
+    # The table itself is the only build state besides a small JSON
+    # checkpoint: pass d re-reads the positions at distance d from the file,
+    # so work lost to an interruption is simply redone.
+
+    def __init__(self, path, workers=None, chunk=20000):
+        self.path = path
+        self.state_path = path + '.state'
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk = chunk
+
+    def load_state(self):
+        if os.path.exists(self.state_path) and self.same_version():
+            with open(self.state_path) as f:
+                return json.load(f)
+        with open(self.path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, SIZE))
+            f.truncate(HEADER.size + SIZE)
+        return {'stage': 'seed', 'next': 0}
+
+    def same_version(self):
+        # a build of an older format starts over instead of resuming
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, 'rb') as f:
+            header = f.read(HEADER.size)
+        return len(header) == HEADER.size and HEADER.unpack(header)[:2] == (MAGIC, VERSION)
+
+    def save_state(self, state, table):
+        table.flush()
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_path)
+
+    def batches(self, chunk, start):
+        step = chunk * self.workers * 4
+        for lo in range(start, SIZE, step):
+            yield [(a, min(a + chunk, SIZE)) for a in range(lo, min(lo + step, SIZE), chunk)]
+
+    def run(self, log=print):
+        state = self.load_state()
+        f, table = _open_table(self.path, write=True)
+        with ProcessPoolExecutor(self.workers) as executor:
+            if state['stage'] == 'seed':
+                self.seed(state, table, executor, log)
+            while state['stage'] == 'retro':
+                self.retro_pass(state, table, executor, log)
+        table[5] = 1  # complete flag
+        table.flush()
+        table.close()
+        f.close()
+        os.remove(self.state_path)
+
+    def seed(self, state, table, executor, log):
+        started = time.perf_counter()
+        done = 0
+        for ranges in self.batches(self.chunk, state['next']):
+            futures = [executor.submit(_seed_chunk, a, b) for a, b in ranges]
+            for fut in futures:
+                wins, losses = fut.result()
+                for index in wins:
+                    table[HEADER.size + index] = 2
+                for index in losses:
+                    table[HEADER.size + index] = 1
+            done += ranges[-1][1] - ranges[0][0]
+            state['next'] = ranges[-1][1]
+            self.save_state(state, table)
+            log('seed %d/%d (%.0f positions/s)' % (state['next'], SIZE, done / (time.perf_counter() - started)))
+        state.update(stage='retro', distance=0, next=0, expanded=0)
+        self.save_state(state, table)
+
+    def retro_pass(self, state, table, executor, log):
+        distance = state['distance']
+        if distance + 1 > MAX_DISTANCE:
+            raise RuntimeError('distance to win does not fit in one byte')
+        for ranges in self.batches(self.chunk, state['next']):
+            futures = [executor.submit(_retro_chunk, self.path, a, b, distance) for a, b in ranges]
+            for fut in futures:
+                expanded, found = fut.result()
+                state['expanded'] += expanded
+                for index in found:
+                    if not table[HEADER.size + index]:
+                        table[HEADER.size + index] = distance + 2
+            state['next'] = ranges[-1][1]
+            self.save_state(state, table)
+        log('distance %d: %d positions' % (distance, state['expanded']))
+        if state['expanded'] == 0 and distance > 0:
+            state['stage'] = 'done'
+        else:
+            state.update(distance=distance + 1, next=0, expanded=0)
+        self.save_state(state, table)
+
+
+class Tablebase:
+    def __init__(self, path=DEFAULT_PATH):
+        self.file, self.table = _open_table(path)
+        magic, version, complete, size = HEADER.unpack_from(self.table)
+        if magic != MAGIC or version != VERSION or size != SIZE:
+            raise ValueError('%s is not an Animal Shogi tablebase' % path)
+        if not complete:
+            raise ValueError('%s is incomplete; run the builder again to resume it' % path)
+
+    def close(self):
+        self.table.close()
+        self.file.close()
+
+    def probe(self, pos):
+        # raw value for the side to move: 0 draw, otherwise distance + 1
+        return self.table[HEADER.size + index_of(pos.bb, pos.hands, pos.side)]
+
+    def best_move(self, pos):
+        # (move, value) where value is from the point of view of pos.side;
+        # wins are taken as fast as possible and losses delayed
+        pos = pos.copy()
+        best_move = None
+        best_rank = None
+        for mv in pos.generate_moves():
+            undo = pos.make_move(mv)
+            if not pos.bb[pos.side * 5 + LION]:
+                pos.unmake_move(mv, undo)
+                return mv, 2
+            value = self.probe(pos)
+            pos.unmake_move(mv, undo)
+            if value == 0:
+                rank = (1, 0)
+            elif value % 2:
+                rank = (2, -value)  # opponent loses
+            else:
+                rank = (0, value)
+            if best_rank is None or rank > best_rank:
+                best_rank = rank
+                best_move = mv
+        if best_rank is None:
+            return None, 1
+        kind, value = best_rank
+        return best_move, (0 if kind == 1 else (1 - value if kind == 2 else value + 1))
+
+
+def open_tablebase(path=DEFAULT_PATH):
+    # the tablebase at path, or None if it has not been (fully) built
+    if not os.path.exists(path):
+        return None
+    try:
+        return Tablebase(path)
+    except ValueError:
+        return None
+
+
+def describe(value):
+    if value == 0:
+        return 'draw', None
+    return ('win' if value % 2 == 0 else 'loss'), value - 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build or query the Animal Shogi tablebase.')
+    parser.add_argument('--out', default=DEFAULT_PATH, help='tablebase file (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all CPUs)')
+    parser.add_argument('--chunk', type=int, default=20000, help='positions per task')
+    parser.add_argument('--probe', action='store_true', help='probe the initial position instead of building')
+    parser.add_argument('--check', type=int, nargs='?', const=1000, metavar='SAMPLES',
+                        help='check the index and the un-moves on sampled positions instead of building '
+                             '(default: %(const)s samples)')
+    args = parser.parse_args(argv)
+    if args.check is not None:
+        failures = self_check(args.check)
+        for failure in failures:
+            print(failure, file=sys.stderr)
+        print('%d samples: %s' % (args.check, '%d failures' % len(failures) if failures else 'ok'))
+        return 1 if failures else 0
+    if args.probe:
+        tb = Tablebase(args.out)
+        pos = Position.initial()
+        result, distance = describe(tb.probe(pos))
+        print('initial position: %s for player 1 (%s plies)' % (result, distance))
+        return 0
+    Builder(args.out, args.workers, args.chunk).run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
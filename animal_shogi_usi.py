@@ -0,0 +1,258 @@
+# coding: utf-8
+
+# Long-lived Animal Shogi engine speaking a USI-style protocol on stdin and
+# stdout, one command per line. It keeps its transposition table (and, with
+# Threads > 1, its helper processes) between searches and games, so a
+# request costs only the search. animal_shogi_pool.py drives a pool of them.
+#
+#   usi                      -> id name ..., option ..., usiok
+#   setoption name Hash value <MB>
+#   setoption name Threads value <n>    processes of a Lazy SMP search
+#   setoption name RootSplit value true|false
+#                            split the root moves over the Threads processes
+#                            (parallel_search) instead of Lazy SMP
+#   isready                  -> readyok, at once even while searching
+#   usinewgame               (the table is kept: positions recur across games)
+#   position startpos|sfen <sfen> [moves <move> ...]
+#   go [movetime <ms>] [depth <n>] [infinite]
+#      [btime <ms> wtime <ms> [binc <ms> winc <ms>] [byoyomi <ms>]]
+#                            -> info ... lines, then bestmove <move>|resign
+#   stop                     ends the search; bestmove follows (a go infinite
+#                            search holds bestmove until then)
+#   quit
+#
+# Positions are Position.sfen() text ('elg/1c1/1C1/GLE b -'), moves are
+# written as by move_name() (B3-B2, C*B2). 'b' (black) is player 1, who
+# moves first. Scores are from the side to move's point of view, 'score cp'
+# in evaluation units or 'score mate <plies>' (negative when being mated).
+
+import sys
+import threading
+
+from animal_shogi_engine import (MATE_BOUND, MAX_DEPTH, WIN, Position, SearchStats, SharedTranspositionTable,
+                                 TranspositionTable, evaluate_positional, lazy_smp_search, make_executor,
+                                 make_smp_executor, move_name, parallel_search, parse_move, solve_mate)
+
+NAME = 'animal_shogi'
+AUTHOR = 'codex-test'
+DEFAULT_HASH_MB = 16
+MAX_HASH_MB = 1024
+MAX_THREADS = 64
+DEFAULT_TIME_MS = 1000
+# share of the remaining clock spent on one move when playing on a clock
+CLOCK_FRACTION = 20
+
+
+def score_text(score):
+    if score > MATE_BOUND:
+        return 'mate %d' % (WIN - score)
+    if score < -MATE_BOUND:
+        return 'mate -%d' % (WIN + score)
+    return 'cp %d' % score
+
+
+class InfoStats(SearchStats):
+    # sends an info line as every iteration completes
+    def __init__(self, send):
+        super().__init__()
+        self.send = send
+
+    def add_iteration(self, result, pv):
+        super().add_iteration(result, pv)
+        self.send('info depth %d score %s nodes %d nps %d time %d pv %s'
+                  % (result.depth, score_text(result.score), result.nodes,
+                     result.nodes / result.time if result.time else 0, result.time * 1000,
+                     ' '.join(map(move_name, pv))))
+
+
+class Engine:
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.lock = threading.Lock()
+        self.pos = Position.initial()
+        self.hash_mb = DEFAULT_HASH_MB
+        self.threads = 1
+        self.split = False
+        self.tt = None
+        self.executor = None
+        self.worker = None
+        self.stop = None
+
+    def send(self, line):
+        with self.lock:
+            self.out.write(line + '\n')
+            self.out.flush()
+
+    def run(self, lines=sys.stdin):
+        for line in lines:
+            if not self.handle(line):
+                break
+        # end of input is a quit: the search must not outlive the table
+        self.halt()
+        self.close()
+
+    def handle(self, line):
+        # one command; returns False on quit
+        words = line.split()
+        if not words:
+            return True
+        command, args = words[0], words[1:]
+        if command in ('stop', 'quit'):
+            self.halt()
+            return command == 'stop'
+        # commands that change the position or the table wait for the
+        # current search to finish; the others are answered at once
+        if command in ('position', 'setoption', 'go'):
+            self.wait()
+        try:
+            if command == 'usi':
+                self.send('id name %s' % NAME)
+                self.send('id author %s' % AUTHOR)
+                self.send('option name Hash type spin default %d min 1 max %d' % (DEFAULT_HASH_MB, MAX_HASH_MB))
+                self.send('option name Threads type spin default 1 min 1 max %d' % MAX_THREADS)
+                self.send('option name RootSplit type check default false')
+                self.send('usiok')
+            elif command == 'isready':
+                # a running search has built the table already
+                if self.worker is None:
+                    self.table()
+                self.send('readyok')
+            elif command == 'setoption':
+                self.set_option(args)
+            elif command == 'position':
+                self.pos = self.parse_position(args)
+            elif command == 'go':
+                self.go(args)
+            elif command != 'usinewgame':
+                self.send('info string unknown command %s' % command)
+        except ValueError as e:
+            self.send('info string error %s' % e)
+        return True
+
+    def set_option(self, args):
+        if len(args) != 4 or args[0] != 'name' or args[2] != 'value':
+            raise ValueError('setoption name <name> value <value>')
+        name, value = args[1], args[3]
+        if name == 'Hash':
+            self.hash_mb = max(1, min(MAX_HASH_MB, int(value)))
+        elif name == 'Threads':
+            self.threads = max(1, min(MAX_THREADS, int(value)))
+        elif name == 'RootSplit':
+            if value not in ('true', 'false'):
+                raise ValueError('RootSplit is true or false')
+            self.split = value == 'true'
+        else:
+            raise ValueError('unknown option %s' % name)
+        self.close()
+
+    def table(self):
+        # the table (and helper processes) for the current options, kept
+        # until an option changes
+        if self.tt is None:
+            if self.threads > 1 and not self.split:
+                self.tt = SharedTranspositionTable(self.hash_mb)
+                self.executor = make_smp_executor(self.tt, self.threads - 1)
+            else:
+                self.tt = TranspositionTable(self.hash_mb)
+                if self.threads > 1:
+                    self.executor = make_executor(self.threads)
+        return self.tt
+
+    def parse_position(self, args):
+        if args[:1] == ['startpos']:
+            pos = Position.initial()
+            rest = args[1:]
+        elif args[:1] == ['sfen'] and len(args) >= 4:
+            pos = Position.from_sfen(' '.join(args[1:4]))
+            rest = args[4:]
+        else:
+            raise ValueError('position startpos|sfen <sfen> [moves ...]')
+        if rest:
+            if rest[0] != 'moves':
+                raise ValueError('expected moves, got %s' % rest[0])
+            for text in rest[1:]:
+                move = parse_move(text)
+                if pos.winner() is not None or not pos.is_legal(move):
+                    raise ValueError('illegal move %s' % text)
+                pos.make_move(move)
+        return pos
+
+    def time_limit(self, options):
+        # ms for this move from the go options, None for no limit
+        if 'infinite' in options or 'depth' in options and 'movetime' not in options:
+            return None
+        if 'movetime' in options:
+            return options['movetime']
+        side = 'b' if self.pos.side == 0 else 'w'
+        if side + 'time' in options:
+            return max(1, options[side + 'time'] // CLOCK_FRACTION + options.get(side + 'inc', 0)
+                       + options.get('byoyomi', 0))
+        return options.get('byoyomi', DEFAULT_TIME_MS)
+
+    def go(self, args):
+        options = {}
+        i = 0
+        while i < len(args):
+            if args[i] == 'infinite':
+                options['infinite'] = True
+                i += 1
+            else:
+                if i + 1 >= len(args):
+                    raise ValueError('go %s needs a value' % args[i])
+                options[args[i]] = int(args[i + 1])
+                i += 2
+        self.stop = threading.Event()
+        self.worker = threading.Thread(target=self.think, args=(self.pos.copy(), options, self.stop), daemon=True)
+        self.worker.start()
+
+    def think(self, pos, options, stop):
+        move = None
+        try:
+            if pos.winner() is not None or not pos.generate_moves():
+                return
+            mate = solve_mate(pos, stop=stop)
+            if mate is not None:
+                move, plies = mate
+                self.send('info depth %d score mate %d pv %s' % (plies, plies, move_name(move)))
+                return
+            tt = self.table()
+            search = parallel_search if self.split else lazy_smp_search
+            result = search(pos, options.get('depth', MAX_DEPTH), evaluate_positional, tt, self.time_limit(options),
+                            stop=stop, workers=self.threads, executor=self.executor, stats=InfoStats(self.send))
+            move = result.move if result else None
+        finally:
+            # an infinite search answers only when stopped, even when it
+            # knows its move sooner
+            if 'infinite' in options:
+                stop.wait()
+            self.send('bestmove %s' % (move_name(move) if move is not None else 'resign'))
+
+    def halt(self):
+        # stops the running search, if any, and waits for its bestmove
+        if self.stop is not None:
+            self.stop.set()
+        self.wait()
+
+    def wait(self):
+        if self.worker is not None:
+            self.worker.join()
+            self.worker = None
+            self.stop = None
+
+    def close(self):
+        # drops the table and helper processes; table() makes new ones
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+        if isinstance(self.tt, SharedTranspositionTable):
+            self.tt.close()
+        self.tt = None
+
+
+def main():
+    Engine().run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
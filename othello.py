@@ -1,15 +1,143 @@
+from othello_engine import (BLACK_START, ENDGAME_EMPTIES, MAX_DEPTH, PASS, WHITE_START, flips, legal_moves, search,
+                            squares)
+
+
+class BoardRow:
+    # One row of Othello.board: reads and writes go straight to the game's
+    # bitboards, so game.board[r][c] = 'B' places a stone.
+    def __init__(self, game, row):
+        self.game = game
+        self.row = row
+
+    def __len__(self):
+        return self.game.SIZE
+
+    def __getitem__(self, col):
+        if isinstance(col, slice):
+            return list(self)[col]
+        bit = self.bit(col)
+        return 'B' if self.game.black & bit else 'W' if self.game.white & bit else '.'
+
+    def __setitem__(self, col, cell):
+        if cell not in ('B', 'W', '.'):
+            raise ValueError('cell must be B, W or ., not %r' % (cell,))
+        bit = self.bit(col)
+        game = self.game
+        game.black &= ~bit
+        game.white &= ~bit
+        if cell == 'B':
+            game.black |= bit
+        elif cell == 'W':
+            game.white |= bit
+
+    def __iter__(self):
+        return (self[c] for c in range(self.game.SIZE))
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def bit(self, col):
+        size = self.game.SIZE
+        if col < 0:
+            col += size
+        if not 0 <= col < size:
+            raise IndexError('column out of range')
+        return 1 << (self.row * size + col)
+
+
 class Othello:
+    # The stones are two 64-bit bitboards (othello_engine); board is the
+    # list-of-rows view of them, built on demand. Its rows write through,
+    # so game.board[r][c] = 'B' works as on a list of lists.
     SIZE = 8
 
     def __init__(self):
-        self.board = [["." for _ in range(self.SIZE)] for _ in range(self.SIZE)]
-        mid = self.SIZE // 2
-        self.board[mid-1][mid-1] = 'W'
-        self.board[mid][mid] = 'W'
-        self.board[mid-1][mid] = 'B'
-        self.board[mid][mid-1] = 'B'
+        self.black = BLACK_START
+        self.white = WHITE_START
         self.current = 'B'
 
+    @property
+    def board(self):
+        return [BoardRow(self, r) for r in range(self.SIZE)]
+
+    @board.setter
+    def board(self, rows):
+        self.black = self.white = 0
+        for r, row in enumerate(rows):
+            for c, cell in enumerate(row):
+                if cell == 'B':
+                    self.black |= 1 << (r * self.SIZE + c)
+                elif cell == 'W':
+                    self.white |= 1 << (r * self.SIZE + c)
+
+    def stones(self):
+        # (stones of the side to move, stones of the opponent)
+        if self.current == 'B':
+            return self.black, self.white
+        return self.white, self.black
+
+    def legal_moves(self):
+        # the (row, col) squares the side to move can play; empty when it
+        # has to pass or the game is over
+        return [divmod(sq, self.SIZE) for sq in squares(legal_moves(*self.stones()))]
+
+    def must_pass(self):
+        player, opponent = self.stones()
+        return not legal_moves(player, opponent) and bool(legal_moves(opponent, player))
+
+    def is_over(self):
+        player, opponent = self.stones()
+        return not legal_moves(player, opponent) and not legal_moves(opponent, player)
+
+    def play(self, row, col):
+        # Places a stone for the side to move and flips; returns the flipped
+        # (row, col) squares. Raises ValueError if the move is not legal.
+        sq = row * self.SIZE + col
+        player, opponent = self.stones()
+        if not (0 <= row < self.SIZE and 0 <= col < self.SIZE) or not legal_moves(player, opponent) >> sq & 1:
+            raise ValueError('illegal move (%d, %d)' % (row, col))
+        flipped = flips(player, opponent, sq)
+        self.make_move(sq)
+        return [divmod(s, self.SIZE) for s in squares(flipped)]
+
+    def pass_turn(self):
+        if not self.must_pass():
+            raise ValueError('%s cannot pass' % self.current)
+        self.make_move(PASS)
+
+    def make_move(self, move):
+        # move is an engine square number or PASS, assumed legal
+        if move != PASS:
+            player, opponent = self.stones()
+            flipped = flips(player, opponent, move)
+            player |= flipped | 1 << move
+            opponent ^= flipped
+            if self.current == 'B':
+                self.black, self.white = player, opponent
+            else:
+                self.white, self.black = player, opponent
+        self.current = 'W' if self.current == 'B' else 'B'
+
+    def ai_move(self, time_ms=1000, max_depth=MAX_DEPTH, tt=None, endgame_empties=ENDGAME_EMPTIES, stop=None):
+        # the (row, col) the engine plays for the side to move, None when it
+        # has to pass or the game is over (see othello_engine.search)
+        result = search(*self.stones(), max_depth, tt=tt, time_ms=time_ms, stop=stop,
+                        endgame_empties=endgame_empties)
+        if result is None or result.move in (None, PASS):
+            return None
+        return divmod(result.move, self.SIZE)
+
+    def score(self):
+        return self.black.bit_count(), self.white.bit_count()
+
+    def winner(self):
+        # 'B', 'W' or None for a draw, once the game is over
+        black, white = self.score()
+        return 'B' if black > white else 'W' if white > black else None
+
     def print_board(self):
         for row in self.board:
             print(" ".join(row))
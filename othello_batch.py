@@ -0,0 +1,175 @@
+# coding: utf-8
+
+# Many Othello games stepped at once with NumPy.
+#
+# The state of N games is a pair of packed uint64 arrays of shape (N,), the
+# stones of the side to move and of its opponent, laid out as in
+# othello_engine (square r * 8 + c is bit r * 8 + c). Legal moves, flips and
+# move choice are computed for all games with array operations; nothing
+# loops over the games in Python. Finished games stay in the batch and are
+# left unchanged by step().
+
+import numpy as np
+
+from othello_engine import BLACK_START, FULL, LEFT_SHIFTS, PASS, RIGHT_SHIFTS, SQUARES, WHITE_START
+
+_LEFT = [(np.uint64(shift), np.uint64(mask)) for shift, mask in LEFT_SHIFTS]
+_RIGHT = [(np.uint64(shift), np.uint64(mask)) for shift, mask in RIGHT_SHIFTS]
+_FULL = np.uint64(FULL)
+_ZERO = np.uint64(0)
+_ONE = np.uint64(1)
+
+
+def legal_moves(player, opponent):
+    # uint64 masks of the legal moves, as othello_engine.legal_moves
+    empty = ~(player | opponent) & _FULL
+    moves = np.zeros_like(player)
+    for shift, mask in _LEFT:
+        o = opponent & mask
+        x = o & (player << shift)
+        for _ in range(5):
+            x |= o & (x << shift)
+        moves |= empty & mask & (x << shift)
+    for shift, mask in _RIGHT:
+        o = opponent & mask
+        x = o & (player >> shift)
+        for _ in range(5):
+            x |= o & (x >> shift)
+        moves |= empty & mask & (x >> shift)
+    return moves
+
+
+def flips(player, opponent, bit):
+    # Stones flipped by player placing the stones in bit (one per game, or
+    # none). The run of opponent stones from the new stone in each direction
+    # is flipped when the square after it holds a player stone.
+    flipped = np.zeros_like(player)
+    for shift, mask in _LEFT:
+        x = opponent & ((bit << shift) & mask)
+        for _ in range(5):
+            x |= opponent & ((x << shift) & mask)
+        flipped |= np.where((x << shift) & mask & player != 0, x, _ZERO)
+    for shift, mask in _RIGHT:
+        x = opponent & ((bit >> shift) & mask)
+        for _ in range(5):
+            x |= opponent & ((x >> shift) & mask)
+        flipped |= np.where((x >> shift) & mask & player != 0, x, _ZERO)
+    return flipped
+
+
+# bits set in every byte value, for NumPy before 2.0 (no bitwise_count)
+_BYTE_COUNTS = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount(masks):
+    # (N,) uint8 counts of the bits set in (N,) uint64 masks
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(masks)
+    bytes_ = masks.astype('<u8').view(np.uint8).reshape(-1, 8)
+    return _BYTE_COUNTS[bytes_].sum(axis=1, dtype=np.uint8)
+
+
+def unpack(masks):
+    # (N,) uint64 masks as an (N, 64) bool array indexed by square
+    bytes_ = masks.astype('<u8').view(np.uint8).reshape(-1, 8)
+    return np.unpackbits(bytes_, axis=1, bitorder='little').astype(bool)
+
+
+class OthelloBatch:
+    def __init__(self, n):
+        self.player = np.full(n, BLACK_START, dtype=np.uint64)
+        self.opponent = np.full(n, WHITE_START, dtype=np.uint64)
+        self.black_to_move = np.ones(n, dtype=bool)
+        self.done = np.zeros(n, dtype=bool)
+        self.moves = legal_moves(self.player, self.opponent)
+
+    @classmethod
+    def from_games(cls, games):
+        # a batch holding the positions of Othello objects
+        batch = cls(len(games))
+        black = np.array([game.black for game in games], dtype=np.uint64)
+        white = np.array([game.white for game in games], dtype=np.uint64)
+        batch.black_to_move = np.array([game.current == 'B' for game in games], dtype=bool)
+        batch.player = np.where(batch.black_to_move, black, white)
+        batch.opponent = np.where(batch.black_to_move, white, black)
+        batch._update()
+        return batch
+
+    def __len__(self):
+        return len(self.player)
+
+    def _update(self):
+        # legal moves of the side to move; a game is over when neither side
+        # can move
+        self.moves = legal_moves(self.player, self.opponent)
+        stuck = np.flatnonzero(self.moves == 0)
+        if len(stuck):
+            self.done[stuck] = legal_moves(self.opponent[stuck], self.player[stuck]) == 0
+
+    def legal_mask(self):
+        # (N, 64) bool: the legal squares of every game
+        return unpack(self.moves)
+
+    def boards(self):
+        # (N, 8, 8) int8: 1 for black, -1 for white, 0 for empty
+        black = np.where(self.black_to_move, self.player, self.opponent)
+        white = np.where(self.black_to_move, self.opponent, self.player)
+        return (unpack(black).astype(np.int8) - unpack(white)).reshape(-1, 8, 8)
+
+    def scores(self):
+        # (black, white) stone counts, (N,) each
+        black = np.where(self.black_to_move, self.player, self.opponent)
+        white = np.where(self.black_to_move, self.opponent, self.player)
+        return popcount(black), popcount(white)
+
+    def winners(self):
+        # 1 black, -1 white, 0 draw, for every game (meaningful once done)
+        black, white = self.scores()
+        return np.sign(black.astype(np.int8) - white.astype(np.int8))
+
+    def policy_moves(self, logits, rng=None, temperature=1.0):
+        # Chooses a move per game from (N, 64) logits restricted to the legal
+        # squares: sampled with the Gumbel-max trick at the given temperature,
+        # or the best legal square when temperature is 0. Games without a
+        # legal move get PASS.
+        logits = np.asarray(logits, dtype=np.float64)
+        if temperature:
+            rng = rng or np.random.default_rng()
+            logits = logits / temperature + rng.gumbel(size=logits.shape)
+        legal = self.legal_mask()
+        choice = np.where(legal, logits, -np.inf).argmax(axis=1)
+        return np.where(legal.any(axis=1), choice, PASS)
+
+    def random_moves(self, rng=None):
+        # a uniformly random legal move (or PASS) per game
+        rng = rng or np.random.default_rng()
+        legal = self.legal_mask()
+        choice = np.where(legal, rng.random(legal.shape), -1.0).argmax(axis=1)
+        return np.where(legal.any(axis=1), choice, PASS)
+
+    def step(self, moves):
+        # Plays one move per unfinished game: a legal square or PASS when the
+        # game has none (moves are not checked). Returns the number of games
+        # that moved.
+        moves = np.asarray(moves)
+        playing = ~self.done
+        placing = playing & (moves != PASS)
+        bit = np.where(placing, _ONE << np.minimum(moves, SQUARES - 1).astype(np.uint64), _ZERO)
+        flipped = flips(self.player, self.opponent, bit)
+        player = self.player
+        self.player = np.where(playing, self.opponent ^ flipped, self.player)
+        self.opponent = np.where(playing, player | flipped | bit, self.opponent)
+        self.black_to_move ^= playing
+        self._update()
+        return int(playing.sum())
+
+    def play_random(self, rng=None, max_plies=None):
+        # Plays random moves until every game is over (or for max_plies
+        # steps); returns the number of positions played through.
+        rng = rng or np.random.default_rng()
+        positions = 0
+        plies = 0
+        while not self.done.all() and (max_plies is None or plies < max_plies):
+            positions += self.step(self.random_moves(rng))
+            plies += 1
+        return positions
@@ -0,0 +1,159 @@
+# coding: utf-8
+
+# Perft and endgame benchmarks for the Othello bitboard engine.
+#
+# Counts are checked against the standard reference numbers for the initial
+# position (a pass counts as a move, a finished game is a leaf), so a change
+# to move generation or flips that alters them fails the run. The endgame
+# positions below are solved exactly and their scores checked as well; they
+# come from engine games and are kept small (10 to 16 empty squares) since
+# the usual 20+ empty test suites are out of reach of the pure Python
+# solver. The result is one JSON document. With --batch N it
+# also plays N random games at once with othello_batch (needs NumPy) and
+# compares positions per second with random games of the Othello class.
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+from othello import Othello
+from othello_engine import (BLACK_START, SQUARES, WHITE_START, TranspositionTable, parse_position, perft,
+                            search)
+
+PERFT = (4, 12, 56, 244, 1396, 8200, 55092, 390216, 3005288, 24571284, 212258800, 1939886636)
+SCALAR_GAMES = 200
+TT_SIZE_MB = 16
+
+# endgame positions (see parse_position) with the exact final disc
+# difference for the side to move
+ENDGAMES = {
+    'e10a': ('--OOXXXX--OOOOXX-OOXOXOX--OOXXOX-XXOXOOX-OXXOOOX-OOXOOOXXOXXXXXX X', 26),
+    'e10b': ('XOOO----XXO-O---XXXOOO--XXOXXXXXXXOXXXXXXXXXXXXXXXOXOOXXXXXXXXXX O', -44),
+    'e12a': ('-OXXXXX--OOXX---OOOOXXXXOOXOXXXXOOXXOOOXOOOXXOOX--XXXOO--XXXXX-- X', 36),
+    'e12b': ('--O-OOO---OOOO--XXXXOXO-XXXOOOOOXXXOXXOOXOOXOXOOOXXOXX-OXXXXXX-- X', 32),
+    'e14a': ('--OO----X-OOOO-XXXXXOOXXXOXOOOOXXOOXXOXXX-XOXOXX--XXOOXX--XXXO-X X', 18),
+    'e14b': ('-----O----OOXOOX--OOXOXXXOOXOOXXOOOOXOXXOOXOXOXX--XXOXXX-XXXXXXX X', 46),
+    'e16a': ('----OOO---XXXO--XXXXOXOOXXXOOXOOXOXOOXXOXOXXXXXO--OOOO----OOOOO- X', -20),
+}
+
+
+def bench_perft(depth):
+    start = time.perf_counter()
+    nodes = perft(BLACK_START, WHITE_START, depth)
+    elapsed = time.perf_counter() - start
+    return {
+        'depth': depth,
+        'nodes': nodes,
+        'expected': PERFT[depth - 1] if depth <= len(PERFT) else None,
+        'seconds': round(elapsed, 4),
+        'nps': round(nodes / elapsed) if elapsed else None,
+    }
+
+
+def bench_endgame(name):
+    text, expected = ENDGAMES[name]
+    player, opponent, _ = parse_position(text)
+    result = search(player, opponent, tt=TranspositionTable(TT_SIZE_MB), endgame_empties=SQUARES)
+    return {
+        'position': name,
+        'empties': result.depth,
+        'score': result.score,
+        'expected': expected,
+        'move': result.move,
+        'nodes': result.nodes,
+        'seconds': round(result.time, 4),
+        'nps': round(result.nodes / result.time) if result.time else None,
+    }
+
+
+def bench_scalar(games, seed=0):
+    # random games played one Othello object at a time
+    rng = random.Random(seed)
+    positions = 0
+    start = time.perf_counter()
+    for _ in range(games):
+        game = Othello()
+        while not game.is_over():
+            moves = game.legal_moves()
+            if moves:
+                game.play(*rng.choice(moves))
+            else:
+                game.pass_turn()
+            positions += 1
+    elapsed = time.perf_counter() - start
+    return {'games': games, 'positions': positions, 'seconds': round(elapsed, 4),
+            'positions_per_second': round(positions / elapsed) if elapsed else None}
+
+
+def bench_batch(games, seed=0):
+    # the same, all games at once
+    import numpy as np
+    from othello_batch import OthelloBatch
+
+    start = time.perf_counter()
+    positions = OthelloBatch(games).play_random(np.random.default_rng(seed))
+    elapsed = time.perf_counter() - start
+    return {'games': games, 'positions': positions, 'seconds': round(elapsed, 4),
+            'positions_per_second': round(positions / elapsed) if elapsed else None}
+
+
+def run(perft_depth=9, batch=0, max_empties=16):
+    perfts = [bench_perft(depth) for depth in range(1, perft_depth + 1)]
+    endgames = [bench_endgame(name) for name, (text, _) in ENDGAMES.items()
+                if text.count('-') <= max_empties]
+    seconds = sum(row['seconds'] for row in perfts)
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'perft': perfts,
+        'endgame': endgames,
+        'summary': {
+            'perft_nps': round(sum(row['nodes'] for row in perfts) / seconds) if seconds else None,
+            'perft_ok': all(row['expected'] in (None, row['nodes']) for row in perfts),
+            'endgame_seconds': round(sum(row['seconds'] for row in endgames), 4),
+            'endgame_ok': all(row['score'] == row['expected'] for row in endgames),
+        },
+    }
+    if batch:
+        scalar = bench_scalar(min(batch, SCALAR_GAMES))
+        batched = bench_batch(batch)
+        report['playout'] = {'scalar': scalar, 'batch': batched}
+        if scalar['positions_per_second'] and batched['positions_per_second']:
+            report['summary']['batch_speedup'] = round(
+                batched['positions_per_second'] / scalar['positions_per_second'], 1)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Othello engine.')
+    parser.add_argument('--perft-depth', type=int, default=9, help='deepest perft (default: %(default)s)')
+    parser.add_argument('--max-empties', type=int, default=16,
+                        help='solve the endgame positions with at most this many empties, 0 for none '
+                             '(default: %(default)s)')
+    parser.add_argument('--batch', type=int, default=0, metavar='N',
+                        help='also time N random games played at once with NumPy')
+    parser.add_argument('--out', default='-', help='JSON output file (default: stdout)')
+    args = parser.parse_args(argv)
+    report = run(args.perft_depth, args.batch, args.max_empties)
+    text = json.dumps(report, indent=2)
+    if args.out == '-':
+        print(text)
+    else:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    for row in report['perft']:
+        if row['expected'] not in (None, row['nodes']):
+            print('perft mismatch: depth %d: %d, expected %d' % (row['depth'], row['nodes'], row['expected']),
+                  file=sys.stderr)
+    for row in report['endgame']:
+        if row['score'] != row['expected']:
+            print('endgame mismatch: %s: %d, expected %d' % (row['position'], row['score'], row['expected']),
+                  file=sys.stderr)
+    return 0 if report['summary']['perft_ok'] and report['summary']['endgame_ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
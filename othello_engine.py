@@ -0,0 +1,506 @@
+# coding: utf-8
+
+# Bitboard engine for Othello.
+#
+# A position is two 64-bit masks, the stones of the side to move and of the
+# opponent; square r * 8 + c is bit r * 8 + c, row 0 at the top. Moves are
+# square numbers, PASS when the side to move has none but the game goes on.
+# Legal moves and flips are found with shift-and-mask fills in the eight
+# directions.
+#
+# search() picks a move: principal variation search with iterative
+# deepening, a transposition table and mobility/corner move ordering, and an
+# exact solver with parity ordering once few enough squares are empty.
+
+import time
+from array import array
+from collections import namedtuple
+
+SIZE = 8
+SQUARES = SIZE * SIZE
+FULL = (1 << SQUARES) - 1
+PASS = SQUARES
+
+NOT_FIRST_COL = FULL & ~sum(1 << (r * SIZE) for r in range(SIZE))
+NOT_LAST_COL = FULL & ~sum(1 << (r * SIZE + SIZE - 1) for r in range(SIZE))
+
+# (shift, mask) per direction: shifting left moves towards higher squares,
+# the mask drops stones that wrapped around to the other edge
+LEFT_SHIFTS = ((1, NOT_FIRST_COL), (SIZE, FULL), (SIZE + 1, NOT_FIRST_COL), (SIZE - 1, NOT_LAST_COL))
+RIGHT_SHIFTS = ((1, NOT_LAST_COL), (SIZE, FULL), (SIZE + 1, NOT_LAST_COL), (SIZE - 1, NOT_FIRST_COL))
+
+# black moves first from d5/e4 black, d4/e5 white
+BLACK_START = 1 << (3 * SIZE + 4) | 1 << (4 * SIZE + 3)
+WHITE_START = 1 << (3 * SIZE + 3) | 1 << (4 * SIZE + 4)
+
+BITS = [tuple(sq for sq in range(16) if mask >> sq & 1) for mask in range(1 << 16)]
+
+
+def squares(mask):
+    # the set squares of a 64-bit mask, in increasing order
+    out = []
+    base = 0
+    while mask:
+        out += [base + sq for sq in BITS[mask & 0xFFFF]]
+        mask >>= 16
+        base += 16
+    return out
+
+
+def legal_moves(player, opponent):
+    # mask of the empty squares where player flips at least one stone
+    empty = FULL & ~(player | opponent)
+    moves = 0
+    for shift, mask in LEFT_SHIFTS:
+        o = opponent & mask
+        x = o & (player << shift)
+        x |= o & (x << shift)
+        x |= o & (x << shift)
+        x |= o & (x << shift)
+        x |= o & (x << shift)
+        x |= o & (x << shift)
+        moves |= empty & mask & (x << shift)
+    for shift, mask in RIGHT_SHIFTS:
+        o = opponent & mask
+        x = o & (player >> shift)
+        x |= o & (x >> shift)
+        x |= o & (x >> shift)
+        x |= o & (x >> shift)
+        x |= o & (x >> shift)
+        x |= o & (x >> shift)
+        moves |= empty & mask & (x >> shift)
+    return moves
+
+
+def flips(player, opponent, sq):
+    # mask of the opponent stones flipped by player playing on sq
+    bit = 1 << sq
+    flipped = 0
+    for shift, mask in LEFT_SHIFTS:
+        line = 0
+        x = (bit << shift) & mask
+        while x & opponent:
+            line |= x
+            x = (x << shift) & mask
+        if x & player:
+            flipped |= line
+    for shift, mask in RIGHT_SHIFTS:
+        line = 0
+        x = (bit >> shift) & mask
+        while x & opponent:
+            line |= x
+            x = (x >> shift) & mask
+        if x & player:
+            flipped |= line
+    return flipped
+
+
+def play(player, opponent, move):
+    # the position after move, from the point of view of the next player
+    if move == PASS:
+        return opponent, player
+    flipped = flips(player, opponent, move)
+    return opponent ^ flipped, player | flipped | 1 << move
+
+
+def game_over(player, opponent):
+    return not legal_moves(player, opponent) and not legal_moves(opponent, player)
+
+
+def perft(player, opponent, depth, passed=False):
+    # Number of move sequences of the given length, a pass counting as a
+    # move; a finished game is a leaf wherever it ends. Matches the usual
+    # reference numbers (4, 12, 56, 244, 1396, ...).
+    if depth == 0:
+        return 1
+    moves = legal_moves(player, opponent)
+    if not moves:
+        if passed:
+            return 1
+        return perft(opponent, player, depth - 1, True)
+    if depth == 1:
+        return moves.bit_count()
+    nodes = 0
+    for sq in squares(moves):
+        flipped = flips(player, opponent, sq)
+        nodes += perft(opponent ^ flipped, player | flipped | 1 << sq, depth - 1)
+    return nodes
+
+
+def final_score(player, opponent):
+    # disc difference of a finished game, empty squares going to the winner
+    diff = player.bit_count() - opponent.bit_count()
+    empties = SQUARES - player.bit_count() - opponent.bit_count()
+    if diff > 0:
+        return diff + empties
+    if diff < 0:
+        return diff - empties
+    return 0
+
+
+def neighbours(mask):
+    # the squares next to any square of mask
+    out = 0
+    for shift, edge in LEFT_SHIFTS:
+        out |= (mask << shift) & edge
+    for shift, edge in RIGHT_SHIFTS:
+        out |= (mask >> shift) & edge
+    return out
+
+
+def parse_position(text):
+    # '64 board characters side', X (or B) black, O (or W) white, - or .
+    # empty, the side to move X or O: the usual endgame test format.
+    # Returns (player, opponent, black_to_move).
+    board, side = text.split()
+    if len(board) != SQUARES or side not in 'XOBW':
+        raise ValueError('bad Othello position %r' % text)
+    black = sum(1 << sq for sq, cell in enumerate(board) if cell in 'XB')
+    white = sum(1 << sq for sq, cell in enumerate(board) if cell in 'OW')
+    if side in 'XB':
+        return black, white, True
+    return white, black, False
+
+
+def position_text(player, opponent, black_to_move=True):
+    black, white = (player, opponent) if black_to_move else (opponent, player)
+    board = ''.join('X' if black >> sq & 1 else 'O' if white >> sq & 1 else '-' for sq in range(SQUARES))
+    return board + (' X' if black_to_move else ' O')
+
+
+MASK64 = (1 << 64) - 1
+
+
+def position_key(player, opponent):
+    # 64-bit hash of a position (a multiply-xorshift mix of the two masks)
+    h = player * 0x9E3779B97F4A7C15 & MASK64
+    h ^= h >> 31
+    h = (h ^ opponent) * 0xBF58476D1CE4E5B9 & MASK64
+    return h ^ h >> 29 or 1
+
+
+# Evaluation of a position for the side to move, in hundredths of a disc:
+# mobility, potential mobility (empty squares next to enemy stones), corners,
+# and the X and C squares next to corners that are still empty. A finished
+# game scores WIN plus the disc difference.
+WIN = 10000
+CORNERS = 1 | 1 << 7 | 1 << 56 | 1 << 63
+CORNER_ZONES = [(1 << corner, 1 << x, cs) for corner, x, cs in (
+    (0, 9, 1 << 1 | 1 << 8), (7, 14, 1 << 6 | 1 << 15), (56, 49, 1 << 48 | 1 << 57), (63, 54, 1 << 55 | 1 << 62))]
+MOBILITY_WEIGHT = 8
+POTENTIAL_WEIGHT = 3
+CORNER_WEIGHT = 80
+X_SQUARE_WEIGHT = 40
+C_SQUARE_WEIGHT = 12
+
+
+def evaluate(player, opponent):
+    empty = FULL & ~(player | opponent)
+    score = MOBILITY_WEIGHT * (legal_moves(player, opponent).bit_count()
+                               - legal_moves(opponent, player).bit_count())
+    score += POTENTIAL_WEIGHT * ((neighbours(opponent) & empty).bit_count()
+                                 - (neighbours(player) & empty).bit_count())
+    score += CORNER_WEIGHT * ((player & CORNERS).bit_count() - (opponent & CORNERS).bit_count())
+    for corner, x, cs in CORNER_ZONES:
+        if empty & corner:
+            score -= X_SQUARE_WEIGHT * (bool(player & x) - bool(opponent & x))
+            score -= C_SQUARE_WEIGHT * ((player & cs).bit_count() - (opponent & cs).bit_count())
+    return score
+
+
+EXACT, LOWER, UPPER = 0, 1, 2
+NO_MOVE = 255
+ENDGAME_KEY = 0x5DEECE66D2F8A3B1
+
+
+class TranspositionTable:
+    # One entry per slot, (key, data) in flat 64-bit arrays (16 bytes per
+    # entry). data packs move | depth << 8 | bound << 14 | (score + 2**17) << 16
+    # | generation << 34; an entry of an older search or a shallower one is
+    # replaced. Exact solver entries use the key xor ENDGAME_KEY and their
+    # depth is the number of empty squares.
+    ENTRY_BYTES = 16
+
+    def __init__(self, size_mb=16):
+        entries = max(1, (size_mb << 20) // self.ENTRY_BYTES)
+        entries = 1 << (entries.bit_length() - 1)
+        self.mask = entries - 1
+        self.keys = array('Q', bytes(8 * entries))
+        self.data = array('Q', bytes(8 * entries))
+        self.generation = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def new_search(self):
+        self.generation = (self.generation + 1) & 255
+
+    def clear(self):
+        n = len(self.keys)
+        self.keys = array('Q', bytes(8 * n))
+        self.data = array('Q', bytes(8 * n))
+        self.generation = 0
+
+    def probe(self, key):
+        i = key & self.mask
+        return self.data[i] if self.keys[i] == key else 0
+
+    def store(self, key, move, depth, bound, score):
+        i = key & self.mask
+        old = self.data[i]
+        if self.keys[i] != key and old >> 34 == self.generation and (old >> 8 & 63) > depth:
+            return
+        self.keys[i] = key
+        self.data[i] = move | min(depth, 63) << 8 | bound << 14 | (score + (1 << 17)) << 16 | self.generation << 34
+
+
+MAX_DEPTH = 60
+ENDGAME_EMPTIES = 12
+
+# score is from the side to move's point of view: the evaluation scale for a
+# depth-limited search, the final disc difference when exact is set (depth is
+# then the number of empty squares); move is PASS when there is nothing else
+SearchResult = namedtuple('SearchResult', 'score move depth nodes time exact')
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+# Move ordering: the hash move, then by square (corners first, squares next
+# to an empty corner last) and, from ORDER_MOBILITY_DEPTH up, by how few
+# moves are left to the opponent. In the exact solver, from
+# FASTEST_FIRST_EMPTIES up moves are ordered by opponent mobility, below it
+# moves into regions (quadrants) with an odd number of empty squares come
+# first; the solver uses the table from ENDGAME_TT_EMPTIES up.
+ORDER_HASH = 1 << 20
+ORDER_MOBILITY_DEPTH = 3
+ORDER_MOBILITY = 64
+FASTEST_FIRST_EMPTIES = 7
+ENDGAME_TT_EMPTIES = 8
+SQUARE_ORDER = [
+    9, 1, 6, 5, 5, 6, 1, 9,
+    1, 0, 3, 3, 3, 3, 0, 1,
+    6, 3, 4, 4, 4, 4, 3, 6,
+    5, 3, 4, 4, 4, 4, 3, 5,
+    5, 3, 4, 4, 4, 4, 3, 5,
+    6, 3, 4, 4, 4, 4, 3, 6,
+    1, 0, 3, 3, 3, 3, 0, 1,
+    9, 1, 6, 5, 5, 6, 1, 9,
+]
+QUADRANTS = [sum(1 << (r * SIZE + c) for r in rows for c in cols)
+             for rows in (range(4), range(4, 8)) for cols in (range(4), range(4, 8))]
+
+
+class Searcher:
+    def __init__(self, evaluate=evaluate, tt=None, time_ms=None, max_nodes=None, stop=None):
+        self.evaluate = evaluate
+        self.tt = tt
+        self.time_ms = time_ms
+        self.max_nodes = max_nodes
+        self.stop = stop
+        self.deadline = None
+        self.limited = stop is not None
+        self.completed_depth = 0
+        self.root_move = None
+        self.nodes = 0
+
+    def check_budget(self):
+        # as in the Animal Shogi searcher: stop cancels at once, the time
+        # and node budget apply once the first iteration has completed
+        if self.stop is not None and self.stop.is_set():
+            raise SearchTimeout
+        if not self.completed_depth:
+            return
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchTimeout
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            raise SearchTimeout
+
+    def hash_entry(self, key):
+        if self.tt is None:
+            return 0, None
+        entry = self.tt.probe(key)
+        move = entry & 255 if entry else NO_MOVE
+        return entry, None if move == NO_MOVE else move
+
+    def negamax(self, player, opponent, depth, ply, alpha, beta, passed=False):
+        self.nodes += 1
+        if self.limited and not self.nodes & 1023:
+            self.check_budget()
+        moves = legal_moves(player, opponent)
+        if not moves:
+            if passed:
+                score = final_score(player, opponent)
+                return (score + WIN if score > 0 else score - WIN if score < 0 else 0), None
+            score, _ = self.negamax(opponent, player, depth, ply + 1, -beta, -alpha, True)
+            return -score, PASS
+        if depth == 0:
+            return self.evaluate(player, opponent), None
+
+        key = position_key(player, opponent)
+        entry, hash_move = self.hash_entry(key)
+        if entry and ply and (entry >> 8 & 63) >= depth:
+            score = (entry >> 16 & 0x3FFFF) - (1 << 17)
+            bound = entry >> 14 & 3
+            if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+                return score, hash_move
+        if not ply and self.root_move is not None:
+            hash_move = self.root_move
+
+        alpha_orig = alpha
+        best = -WIN - SQUARES - 1
+        best_move = None
+        for _, sq, flipped in self.order_moves(player, opponent, moves, hash_move, depth):
+            child = opponent ^ flipped, player | flipped | 1 << sq
+            if best_move is None:
+                score = -self.negamax(*child, depth - 1, ply + 1, -beta, -alpha)[0]
+            else:
+                # null window first; a move that beats alpha is searched again
+                score = -self.negamax(*child, depth - 1, ply + 1, -alpha - 1, -alpha)[0]
+                if alpha < score < beta:
+                    score = -self.negamax(*child, depth - 1, ply + 1, -beta, -alpha)[0]
+            if score > best:
+                best = score
+                best_move = sq
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        if self.tt is not None:
+            bound = LOWER if best >= beta else EXACT if best > alpha_orig else UPPER
+            self.tt.store(key, best_move, depth, bound, best)
+        return best, best_move
+
+    def order_moves(self, player, opponent, moves, hash_move, depth):
+        # (order, square, flipped) for every move, best first
+        scored = []
+        for sq in squares(moves):
+            flipped = flips(player, opponent, sq)
+            if sq == hash_move:
+                score = ORDER_HASH
+            else:
+                score = SQUARE_ORDER[sq]
+                if depth >= ORDER_MOBILITY_DEPTH:
+                    score -= ORDER_MOBILITY * legal_moves(opponent ^ flipped, player | flipped | 1 << sq).bit_count()
+            scored.append((score, sq, flipped))
+        scored.sort(reverse=True)
+        return scored
+
+    def solve(self, player, opponent, alpha, beta, passed=False):
+        # exact final disc difference (and best move) with the side to move
+        self.nodes += 1
+        if self.limited and not self.nodes & 1023:
+            self.check_budget()
+        moves = legal_moves(player, opponent)
+        if not moves:
+            if passed:
+                return final_score(player, opponent), None
+            return -self.solve(opponent, player, -beta, -alpha, True)[0], PASS
+        empty = FULL & ~(player | opponent)
+        empties = empty.bit_count()
+        if empties == 1:
+            flipped = flips(player, opponent, moves.bit_length() - 1).bit_count()
+            return player.bit_count() - opponent.bit_count() + 2 * flipped + 1, moves.bit_length() - 1
+
+        key = None
+        hash_move = None
+        if self.tt is not None and empties >= ENDGAME_TT_EMPTIES:
+            key = position_key(player, opponent) ^ ENDGAME_KEY
+            entry, hash_move = self.hash_entry(key)
+            if entry:
+                score = (entry >> 16 & 0x3FFFF) - (1 << 17)
+                bound = entry >> 14 & 3
+                if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+                    return score, hash_move
+
+        odd = 0
+        for quadrant in QUADRANTS:
+            if (empty & quadrant).bit_count() & 1:
+                odd |= quadrant
+        scored = []
+        for sq in squares(moves):
+            flipped = flips(player, opponent, sq)
+            if sq == hash_move:
+                score = ORDER_HASH
+            else:
+                score = SQUARE_ORDER[sq] + (16 if odd >> sq & 1 else 0)
+                if empties >= FASTEST_FIRST_EMPTIES:
+                    score -= ORDER_MOBILITY * legal_moves(opponent ^ flipped, player | flipped | 1 << sq).bit_count()
+            scored.append((score, sq, flipped))
+        scored.sort(reverse=True)
+
+        alpha_orig = alpha
+        best = -SQUARES - 1
+        best_move = None
+        for _, sq, flipped in scored:
+            child = opponent ^ flipped, player | flipped | 1 << sq
+            if best_move is None:
+                score = -self.solve(*child, -beta, -alpha)[0]
+            else:
+                score = -self.solve(*child, -alpha - 1, -alpha)[0]
+                if alpha < score < beta:
+                    score = -self.solve(*child, -beta, -alpha)[0]
+            if score > best:
+                best = score
+                best_move = sq
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        if key is not None:
+            bound = LOWER if best >= beta else EXACT if best > alpha_orig else UPPER
+            self.tt.store(key, best_move, empties, bound, best)
+        return best, best_move
+
+    def iterate(self, player, opponent, max_depth=MAX_DEPTH):
+        # Iterative deepening, with the same budget rules as the Animal
+        # Shogi searcher: the first iteration always completes unless
+        # stopped, an unfinished one is thrown away, and no new iteration
+        # starts once half of the time is spent.
+        start = time.perf_counter()
+        if self.time_ms is not None:
+            self.deadline = start + self.time_ms / 1000
+        result = None
+        for depth in range(1, max_depth + 1):
+            try:
+                score, move = self.negamax(player, opponent, depth, 0, -WIN - SQUARES - 1, WIN + SQUARES + 1)
+            except SearchTimeout:
+                break
+            elapsed = time.perf_counter() - start
+            result = SearchResult(score, move, depth, self.nodes, elapsed, False)
+            self.root_move = move
+            self.completed_depth = depth
+            self.limited = self.limited or self.deadline is not None or self.max_nodes is not None
+            if move is None or abs(score) > WIN:
+                break
+            if self.time_ms is not None and elapsed * 2000 > self.time_ms:
+                break
+            if self.max_nodes is not None and self.nodes * 2 > self.max_nodes:
+                break
+        return result
+
+    def solve_root(self, player, opponent):
+        start = time.perf_counter()
+        try:
+            score, move = self.solve(player, opponent, -SQUARES - 1, SQUARES + 1)
+        except SearchTimeout:
+            return None
+        empties = SQUARES - (player | opponent).bit_count()
+        return SearchResult(score, move, empties, self.nodes, time.perf_counter() - start, True)
+
+
+def search(player, opponent, max_depth=MAX_DEPTH, evaluate=evaluate, tt=None, time_ms=None, max_nodes=None,
+           stop=None, endgame_empties=ENDGAME_EMPTIES):
+    # Returns a SearchResult for the side to move. With endgame_empties or
+    # fewer empty squares the position is solved exactly; the solve only
+    # honours stop (and returns None if stopped), not the time or node
+    # budget, so the threshold decides how long it may take.
+    if tt is not None:
+        tt.new_search()
+    searcher = Searcher(evaluate, tt, time_ms, max_nodes, stop)
+    if SQUARES - (player | opponent).bit_count() <= endgame_empties:
+        return searcher.solve_root(player, opponent)
+    return searcher.iterate(player, opponent, max_depth)